@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: benchmark.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from vocab import Vocab
+from dataset import Dataset
+from model import Perceptron, StructuredPerceptron
+from bundle import save_bundle, load_bundle
+from optparse import OptionParser, SUPPRESS_HELP
+
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generate_corpus(chars, seed=0):
+    """
+    Generate a synthetic segmented corpus, words are drawn from a Zipf-like lexicon of CJK characters
+    :param chars: approximate number of characters of the corpus
+    :param seed: random seed
+    :return: a list of lines with words separated by two spaces
+    """
+    rand = random.Random(seed)
+    alphabet = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    lexicon = [''.join(rand.choice(alphabet) for _ in range(rand.choice((1, 1, 2, 2, 2, 2, 3, 4))))
+               for _ in range(20000)]
+    weights = [1.0 / (rank + 1) for rank in range(len(lexicon))]
+    punctuations = ['，', '。', '、', '；']
+
+    lines = list()
+    total = 0
+    while total < chars:
+        words = rand.choices(lexicon, weights, k=rand.randint(8, 30))
+        words.append(rand.choice(punctuations))
+        total += sum(len(word) for word in words)
+        lines.append('  '.join(words))
+    return lines
+
+
+def reset_peak():
+    """
+    Reset the peak resident memory of the process, only possible on Linux
+    :return: True if the peak is reset
+    """
+    try:
+        file = open('/proc/self/clear_refs', 'w')
+        file.write('5')
+        file.close()
+        return True
+    except OSError:
+        return False
+
+
+def read_status(field):
+    """
+    Read a memory field of the process from /proc, only possible on Linux
+    :param field: name of field, e.g. 'VmRSS' or 'VmHWM'
+    :return: value in bytes, or None
+    """
+    if not os.path.exists('/proc/self/status'):
+        return None
+    value = None
+    file = open('/proc/self/status', 'r')
+    for line in file:
+        if line.startswith(field + ':'):
+            value = int(line.split()[1]) * 1024
+    file.close()
+    return value
+
+
+def get_peak():
+    """
+    Get the peak resident memory of the process since it started or since the last *reset_peak*
+    :return: peak memory in bytes
+    """
+    peak = read_status('VmHWM')
+    if peak is not None:
+        return peak
+
+    # ru_maxrss is the peak since the process started, in kilobytes on Linux but in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(name, scale, chars, sentences, function):
+    """
+    Run a stage and measure its throughput and its peak memory. The peak is reset before the stage where possible,
+    otherwise it is the peak of the process up to the end of the stage. Memory kept by earlier stages is part of
+    the peak, the growth of memory above what the process held when the stage began is reported too
+    :param name: name of stage
+    :param scale: scale of corpus
+    :param chars: number of characters processed by the stage
+    :param sentences: number of sentences processed by the stage
+    :param function: the stage, a function without arguments
+    :return: a dict of results
+    """
+    base = read_status('VmRSS') if reset_peak() else None
+    begin = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - begin
+    peak = get_peak()
+    growth = None if base is None else peak - base
+
+    result = {
+        'stage': name,
+        'scale': scale,
+        'seconds': round(seconds, 6),
+        'chars_per_sec': round(chars / seconds, 1) if seconds > 0 else None,
+        'sentences_per_sec': round(sentences / seconds, 1) if seconds > 0 else None,
+        'peak_rss_bytes': peak,
+        'peak_growth_bytes': growth
+    }
+    print('%-20s %10d %10.3fs %14.1f chars/s %12.1f sentences/s %8.1f MB %+8.1f MB' % (
+        name, scale, seconds, result['chars_per_sec'] or 0, result['sentences_per_sec'] or 0, peak / 2 ** 20,
+        (growth or 0) / 2 ** 20))
+    return result
+
+
+def run(scale):
+    """
+    Benchmark feature extraction, training and decoding on a synthetic corpus
+    :param scale: approximate number of characters of the corpus
+    :return: a list of dicts of results
+    """
+    lines = generate_corpus(scale)
+    chars = sum(len(''.join(line.split())) for line in lines)
+    dataset = Dataset('keyboard', vocab=Vocab([UNKNOWN]))
+    parsed = list()
+    results = list()
+
+    def extract():
+        for line in lines:
+            parsed.append(dataset.parse_line(line, build=True))
+
+    results.append(measure('extract', scale, chars, len(lines), extract))
+    features_list = [features for features, labels, words in parsed]
+
+    perceptron = Perceptron(dataset.vocab.size())
+    structured = StructuredPerceptron(dataset.vocab.size())
+
+    def perceptron_update():
+        for features, labels, words in parsed:
+            perceptron.update_sentence(features, labels)
+
+    def structured_update():
+        for features, labels, words in parsed:
+            if len(features) > 0:
+                structured.update(features, labels)
+
+    def perceptron_predict():
+        for features in features_list:
+            perceptron.predict_sentence(features)
+
+    def viterbi_predict():
+        for features in features_list:
+            structured.predict(features)
+
+    def viterbi_batch():
+        structured.predict_batch(features_list, BATCH_SIZE)
+
+    results.append(measure('perceptron_update', scale, chars, len(lines), perceptron_update))
+    results.append(measure('structured_update', scale, chars, len(lines), structured_update))
+    results.append(measure('perceptron_predict', scale, chars, len(lines), perceptron_predict))
+    results.append(measure('viterbi_predict', scale, chars, len(lines), viterbi_predict))
+    results.append(measure('viterbi_batch', scale, chars, len(lines), viterbi_batch))
+
+    # Feature lookups of the dict vocabulary and of the vocabulary of a memory-mapped bundle
+    texts = [''.join(line.split()) for line in lines]
+    bundle_file = tempfile.NamedTemporaryFile(suffix=BUNDLE_SUFFIX, delete=False)
+    bundle_file.close()
+    save_bundle(bundle_file.name, dataset.vocab, structured)
+    bundle_dataset = Dataset('keyboard', vocab=load_bundle(bundle_file.name)[0])
+
+    def vocab_lookup():
+        for text in texts:
+            dataset.generate_features(text)
+
+    def bundle_lookup():
+        for text in texts:
+            bundle_dataset.generate_features(text)
+
+    results.append(measure('vocab_lookup', scale, chars, len(lines), vocab_lookup))
+    results.append(measure('bundle_lookup', scale, chars, len(lines), bundle_lookup))
+    os.remove(bundle_file.name)
+    return results
+
+
+def get_revision():
+    """
+    Get the git revision of the working tree, if any
+    :return: commit hash or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='Usage: python %prog [--scales <chars,...>] [-o <filename>]')
+    parser.add_option('--scales',
+                      action='store',
+                      dest='scales',
+                      type='string',
+                      default=','.join(str(scale) for scale in BENCHMARK_SCALES),
+                      help='Comma separated numbers of characters of synthetic corpora, defaults stop at 1M '
+                           'characters as a parsed corpus is kept in memory, 10M characters need about 5 GB')
+    parser.add_option('-o', '--output',
+                      action='store',
+                      dest='outputfile',
+                      type='string',
+                      default=BENCHMARK_OUTPUT,
+                      help='Append results into OUTPUTFILE as JSON lines')
+    parser.add_option('--time',
+                      action='store',
+                      dest='time',
+                      type='string',
+                      help=SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+
+    scales = [int(scale) for scale in options.scales.split(',')]
+    timestamp = options.time or time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    # Every scale runs in a process of its own, so memory left by a scale is never counted in the next one
+    if len(scales) > 1:
+        for scale in scales:
+            subprocess.check_call([sys.executable, sys.argv[0], '--scales', str(scale), '-o', options.outputfile,
+                                   '--time', timestamp])
+        sys.exit(0)
+
+    revision = get_revision()
+    output_file = open(options.outputfile, 'a')
+    for result in run(scales[0]):
+        result['revision'] = revision
+        result['time'] = timestamp
+        output_file.write(json.dumps(result) + '\n')
+    output_file.close()
+    print('Results saved at path', options.outputfile)
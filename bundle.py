@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: bundle.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from model import Perceptron, StructuredPerceptron
+
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+# Layout of a bundle file, all integers are little-endian:
+#   header:      magic, version, structured flag, number of features, size of key blob,
+#                bits of weights, scale of quantized weights, size of normalization steps, 48 bytes so that arrays
+#                are aligned
+#   hashes:      uint64 x count, hashes of feature keys in ascending order, see *hash_key*
+#   offsets:     uint64 x (count + 1), offsets of feature keys in the key blob
+#   weights:     count x 2 weights of feature keys for label 0 and 1
+#   transitions: 4 transitions of structured model, zeros otherwise
+#   keys:        utf-8 encoded feature keys, ordered by hash and concatenated
+#   steps:       comma separated normalization steps the features were extracted with, see normalize.py
+# Weights and transitions are float32 if bits is 32, otherwise integers of *bits* bits times scale
+BUNDLE_MAGIC = b'ZHWSBNDL'
+BUNDLE_VERSION = 5
+BUNDLE_HEADER = struct.Struct('<8sIIQQIdI')
+BUNDLE_DTYPES = {32: '<f4', 16: '<i2', 8: '<i1'}
+
+
+class BundleVocab(object):
+    """
+    A read-only vocabulary backed by the key table of a bundle, keys are found by binary search over their hashes
+    """
+
+    def __init__(self, buffer, hashes, offsets, blob_begin, normalization=NORMALIZATION):
+        """
+        Initialize the vocab
+        :param buffer: memory-mapped bundle
+        :param hashes: hashes of keys in ascending order
+        :param offsets: offsets of keys in the key blob
+        :param blob_begin: position of the key blob in *buffer*
+        :param normalization: normalization steps the keys were extracted with
+        """
+        self.normalization = list(normalization)
+        self.buffer = buffer
+        self.hashes = hashes
+        self.offsets = offsets
+        self.blob_begin = blob_begin
+        self.blob = np.frombuffer(buffer, dtype=np.uint8, count=int(offsets[-1]), offset=blob_begin)
+        self.unknown = self.get_index(UNKNOWN)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.buffer[self.blob_begin + int(self.offsets[idx]):self.blob_begin + int(self.offsets[idx + 1])]
+
+    def size(self):
+        """
+        Get the size of the vocabulary
+        :return: size of the vocabulary
+        """
+        return len(self)
+
+    def get_index(self, key, default=None):
+        """
+        Get index from word
+        :param key: string of a word
+        :param default: return value when *key* is not in vocabulary, default value is index of *UNKNOWN*
+        :return: index of *key* in vocabulary
+        """
+        encoded = key.encode('utf-8')
+        code = hash_key(encoded)
+        idx = int(np.searchsorted(self.hashes, np.uint64(code)))
+        while idx < len(self) and self.hashes[idx] == code:
+            if self[idx] == encoded:
+                return idx
+            idx += 1
+        return self.unknown if default is None else default
+
+    def get_indexes(self, keys, default=None):
+        """
+        Get indexes of many words at once, hashes of all words are searched together
+        and the found keys are checked against the key blob in one comparison
+        :param keys: a list of strings of words
+        :param default: index of words not in vocabulary, default value is index of *UNKNOWN*
+        :return: a list of indexes of *keys* in vocabulary
+        """
+        default = self.unknown if default is None else default
+        if len(keys) == 0 or len(self) == 0:
+            return [default] * len(keys)
+        encoded = [key.encode('utf-8') for key in keys]
+        codes = np.array([(len(key) << 32) | zlib.crc32(key) for key in encoded], dtype=np.uint64)  # see *hash_key*
+        positions = np.minimum(np.searchsorted(self.hashes, codes), len(self) - 1)
+        rows = np.flatnonzero(self.hashes[positions] == codes)
+
+        # Keys of the same hash have the same length, so found keys and their candidates are compared byte by byte
+        lengths = (codes[rows] >> np.uint64(32)).astype(np.intp)
+        total = int(lengths.sum())
+        mismatched = np.zeros(len(rows), dtype=bool)
+        if total > 0:
+            starts = np.cumsum(lengths) - lengths
+            steps = np.arange(total) - np.repeat(starts, lengths)
+            query = np.frombuffer(b''.join([encoded[k] for k in rows.tolist()]), dtype=np.uint8)
+            candidate = self.blob[np.repeat(self.offsets[positions[rows]].astype(np.intp), lengths) + steps]
+            different = query != candidate
+            mismatched[lengths > 0] = np.logical_or.reduceat(different, starts[lengths > 0])
+
+        indexes = np.full(len(keys), default, dtype=np.intp)
+        indexes[rows] = positions[rows]
+        result = indexes.tolist()
+
+        # A mismatch is another key of the same hash, the keys following it are searched one by one
+        for k in rows[mismatched].tolist():
+            result[k] = self.get_index(keys[k], default)
+        return result
+
+    def get_word(self, idx, default=UNKNOWN):
+        """
+        Get word from index
+        :param idx: index of a word
+        :param default: return value when *idx* is out of range, default value is *UNKNOWN*
+        :return: word string whose index in vocabulary is *idx*
+        """
+        if 0 <= idx < len(self):
+            return self[idx].decode('utf-8')
+        return default
+
+
+def hash_key(encoded):
+    """
+    Get the hash of an encoded key, its length is kept in the high 32 bits so keys of the same hash have the same length
+    :param encoded: utf-8 encoded key
+    :return: an unsigned 64-bit integer
+    """
+    return (len(encoded) << 32) | zlib.crc32(encoded)
+
+
+def save_bundle(path, vocab, model, threshold=None, bits=32, normalization=NORMALIZATION):
+    """
+    Pack vocabulary, weights and transitions of a model into a single bundle file
+    :param path: save path
+    :param vocab: vocabulary of the model
+    :param model: a Perceptron or StructuredPerceptron
+    :param threshold: if given, drop features whose absolute weights are not above *threshold*,
+                      dropped features are scored like *UNKNOWN* afterwards
+    :param bits: 32 to keep float weights, 16 or 8 to quantize weights and transitions
+    :param normalization: normalization steps the features of *vocab* were extracted with
+    :return: None
+    """
+    if bits not in BUNDLE_DTYPES:
+        raise ValueError('Unsupported number of bits: %s' % bits)
+
+    keys = [vocab.get_word(i).encode('utf-8') for i in range(vocab.size())]
+    kept = range(len(keys))
+    if threshold is not None:
+        kept = np.flatnonzero(np.abs(np.asarray(model.theta)).max(axis=1) > threshold).tolist()
+        kept = sorted(set(kept) | {vocab.get_index(UNKNOWN)})
+    order = sorted(kept, key=lambda i: (hash_key(keys[i]), keys[i]))
+
+    hashes = np.array([hash_key(keys[i]) for i in order], dtype='<u8')
+    offsets = np.zeros(len(order) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(keys[i]) for i in order])
+
+    # Features are pruned by their float weights, then the kept ones are quantized
+    structured = isinstance(model, StructuredPerceptron)
+    scale = 1.0
+    if bits != 32:
+        model = model.quantize(bits)
+        scale = model.scale
+    weights = np.asarray(model.theta, dtype=BUNDLE_DTYPES[bits])[order]
+    transitions = np.asarray(model.transitions if structured else np.zeros((2, 2)), dtype=BUNDLE_DTYPES[bits])
+
+    steps = ','.join(normalization).encode('utf-8')
+
+    file = open(path, 'wb')
+    file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, int(structured), len(order), int(offsets[-1]),
+                                  bits, scale, len(steps)))
+    file.write(hashes.tobytes())
+    file.write(offsets.tobytes())
+    file.write(weights.tobytes())
+    file.write(transitions.tobytes())
+    for i in order:
+        file.write(keys[i])
+    file.write(steps)
+    file.close()
+
+    print('Model bundle saved at path', path)
+
+
+def load_bundle(path):
+    """
+    Memory-map a bundle file, weights are shared with every process mapping the same file
+    :param path: path of bundle
+    :return: a tuple of (vocab, model), normalization steps of the bundle are kept in *vocab.normalization*
+    """
+    file = open(path, 'rb')
+    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    file.close()
+
+    magic, version, structured, count, blob_size, bits, scale, steps_size = BUNDLE_HEADER.unpack_from(buffer, 0)
+    if magic != BUNDLE_MAGIC:
+        raise ValueError('Not a model bundle: %s' % path)
+    if version != BUNDLE_VERSION:
+        raise ValueError('Model bundle %s has version %d instead of %d, export it again' % (path, version,
+                                                                                            BUNDLE_VERSION))
+    dtype = np.dtype(BUNDLE_DTYPES[bits])
+
+    position = BUNDLE_HEADER.size
+    hashes = np.frombuffer(buffer, dtype='<u8', count=count, offset=position)
+    position += hashes.nbytes
+    offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=position)
+    position += offsets.nbytes
+    weights = np.frombuffer(buffer, dtype=dtype, count=count * 2, offset=position).reshape(count, 2)
+    position += weights.nbytes
+    transitions = np.frombuffer(buffer, dtype=dtype, count=4, offset=position)
+    position += transitions.nbytes
+
+    # Integer weights are kept as they are, predictions are made with integer scores
+    if structured:
+        model = StructuredPerceptron(0)
+        model.transitions = transitions.reshape(2, 2).astype(dtype)
+    else:
+        model = Perceptron(0)
+    model.dimension = count
+    model.theta = weights
+    model.scale = scale
+
+    steps = buffer[position + blob_size:position + blob_size + steps_size].decode('utf-8')
+    normalization = [step for step in steps.split(',') if step]
+
+    print('Model bundle loaded from path', path)
+    return BundleVocab(buffer, hashes, offsets, position, normalization), model
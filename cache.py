@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: cache.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+
+import collections
+import hashlib
+import shutil
+
+import numpy as np
+
+
+class FeatureCache(object):
+    """
+    An on-disk cache of extracted features and labels, stored as memory-mapped arrays with sentence offsets
+    """
+
+    def __init__(self, name, data_path, vocab, normalization=NORMALIZATION):
+        """
+        Initialize the cache, its key is a fingerprint of the data file, the vocabulary and feature extraction
+        :param name: name of dataset
+        :param data_path: path of data file
+        :param vocab: vocabulary used to extract features
+        :param normalization: normalization steps applied before feature extraction
+        """
+        self.name = name
+        self.key = fingerprint(data_path, vocab, normalization)
+        self.path = os.path.join(CACHE_PATH, '.'.join((name, self.key)))
+
+        self.features = None
+        self.labels = None
+        self.offsets = None
+
+    def exists(self):
+        """
+        Check whether a valid cache exists
+        :return: True if the cache of current data file and vocabulary exists
+        """
+        return os.path.exists(os.path.join(self.path, 'offsets.npy'))
+
+    def build(self, sentences):
+        """
+        Write features and labels of all sentences into the cache, stale caches of this dataset are removed
+        :param sentences: an iterable of (features, labels)
+        :return: None
+        """
+        for item in os.listdir(CACHE_PATH):
+            if item.startswith(self.name + '.'):
+                shutil.rmtree(os.path.join(CACHE_PATH, item))
+
+        temp_path = self.path + '.tmp'
+        os.mkdir(temp_path)
+        features_file = open(os.path.join(temp_path, 'features.bin'), 'wb')
+        labels_file = open(os.path.join(temp_path, 'labels.bin'), 'wb')
+        offsets = [0]
+        for features, labels in sentences:
+            features_file.write(np.asarray(features, dtype=np.int32).tobytes())
+            labels_file.write(np.asarray(labels, dtype=np.uint8).tobytes())
+            offsets.append(offsets[-1] + len(labels))
+        features_file.close()
+        labels_file.close()
+
+        # Offsets are written last and renamed into place, so an interrupted build is never used
+        np.save(os.path.join(temp_path, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+        os.rename(temp_path, self.path)
+
+        print('Feature cache saved at path', self.path)
+
+    def load(self):
+        """
+        Memory-map features, labels and offsets of the cache
+        :return: None
+        """
+        self.offsets = np.load(os.path.join(self.path, 'offsets.npy'))
+        total = int(self.offsets[-1])
+
+        features_path = os.path.join(self.path, 'features.bin')
+        if total > 0:
+            width = os.path.getsize(features_path) // (total * 4)
+            self.features = np.memmap(features_path, dtype=np.int32, mode='r', shape=(total, width))
+            self.labels = np.memmap(os.path.join(self.path, 'labels.bin'), dtype=np.uint8, mode='r', shape=(total,))
+        else:
+            self.features = np.zeros((0, 0), dtype=np.int32)
+            self.labels = np.zeros(0, dtype=np.uint8)
+
+        print('Feature cache loaded from path', self.path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        begin, end = self.offsets[item], self.offsets[item + 1]
+        return self.features[begin:end], self.labels[begin:end].tolist()
+
+
+class ResultCache(object):
+    """
+    An LRU cache of segmentation results keyed by a hash of the sentence, for inputs repeating heavily
+    """
+
+    def __init__(self, size):
+        """
+        Initialize the cache
+        :param size: max number of sentences kept, least recently used ones are evicted first
+        """
+        self.size = size
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    @staticmethod
+    def key(sentence):
+        """
+        Get the key of a sentence
+        :param sentence: input sentence
+        :return: a 16-byte digest of *sentence*
+        """
+        return hashlib.blake2b(sentence.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, sentence):
+        """
+        Get the cached result of a sentence and mark it as recently used
+        :param sentence: input sentence
+        :return: the cached result, or None if it is not cached
+        """
+        key = self.key(sentence)
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, sentence, result):
+        """
+        Cache the result of a sentence, evict the least recently used one if the cache is full
+        :param sentence: input sentence
+        :param result: segmentation result of *sentence*
+        :return: None
+        """
+        if self.size <= 0:
+            return
+        key = self.key(sentence)
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def hit_rate(self):
+        """
+        Get the ratio of lookups answered by the cache
+        :return: hit rate, 0 if there is no lookup
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def report(self):
+        """
+        Print hits, misses and hit rate of the cache
+        :return: None
+        """
+        print('Result cache: %d hits, %d misses, hit rate %.2f%%' % (self.hits, self.misses, self.hit_rate() * 100))
+
+
+def fingerprint(data_path, vocab, normalization=NORMALIZATION):
+    """
+    Get a fingerprint of a data file, a vocabulary, feature templates and normalization steps
+    :param data_path: path of data file
+    :param vocab: vocabulary
+    :param normalization: normalization steps applied before feature extraction
+    :return: hex digest string
+    """
+    digest = hashlib.sha1()
+    data_file = open(data_path, 'rb')
+    for block in iter(lambda: data_file.read(1 << 20), b''):
+        digest.update(block)
+    data_file.close()
+
+    digest.update(b'\0')
+    digest.update('\n'.join(vocab.get_word(i) for i in range(vocab.size())).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(repr((FEATURE_TEMPLATES, list(normalization))).encode('utf-8'))
+    return digest.hexdigest()[:16]
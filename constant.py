@@ -12,9 +12,51 @@ DEBUG = True
 
 # Arguments of model
 EPOCH = 10
+CHECKPOINT_INTERVAL = 1
+EARLY_STOP_PATIENCE = 2
+EARLY_STOP_DELTA = 0.0001
+BATCH_SIZE = 512
+CHUNK_SIZE = 4096
+OUTPUT_BUFFER_SIZE = 1 << 20
+UPDATE_EPOCH = 3
+PIPELINE_BATCH_SIZE = 256
+PIPELINE_DEPTH = 16
+MIX_ROUNDS = 8
+
+# Number of sentences sorted by length together when testing, they are decoded in batches of BATCH_SIZE
+DECODE_WINDOW = 4096
+
+# Numbers of characters of benchmark corpora, parsed corpora are kept in memory, so the default stops at 1M
+# characters (about 600 MB), 10M characters need about 5 GB and are only run when asked for with --scales
+BENCHMARK_SCALES = [10000, 100000, 1000000]
+
+# Arguments of segmentation service
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8000
+SERVE_BATCH_SIZE = 64
+SERVE_MAX_WAIT = 0.005
+
+# Thresholds of pruning report
+PRUNE_THRESHOLDS = [0, 0.01, 0.1, 0.5, 1, 2]
+
+# Numbers of bits of quantization report
+QUANTIZE_BITS = [16, 8]
+
+# Feature templates, each is a tuple of character offsets relative to current character:
+# uni-grams of previous, current and next character, bi-grams and the tri-gram around current character
+FEATURE_TEMPLATES = [(-1,), (0,), (1,), (-1, 0), (0, 1), (-1, 1), (-1, 0, 1)]
+
+# Normalization steps applied to characters before features are extracted, see normalize.py.
+# None by default, they are enabled by --normalize, e.g. --normalize nfkc,digit,latin.
+# Steps used to build a vocabulary are saved along with it and checked when it is loaded
+NORMALIZATION = []
+
+# Formats of test result: words separated by spaces, offsets of words, JSON lines
+OUTPUT_FORMATS = ['plain', 'offsets', 'jsonl']
 
 # Constants
 SPACE = [' ', '　']
+SENTENCE_END = ['。', '！', '？', '；', '!', '?', ';']
 UNKNOWN = '<unknown>'
 
 # Path of everything
@@ -24,18 +66,28 @@ DATASET_PATH = os.path.join(PROJECT_PATH, 'data_set')
 TRAIN_DATA = os.path.join(DATASET_PATH, 'train.txt')
 TEST_DATA = os.path.join(DATASET_PATH, 'test.txt')
 TEST_ANSWER = os.path.join(DATASET_PATH, 'test.answer.txt')
+DEV_DATA = os.path.join(DATASET_PATH, 'dev.txt')
+UPDATE_DATA = os.path.join(DATASET_PATH, 'update.txt')
 VOCAB_PATH = os.path.join(DATASET_PATH, 'vocab.txt')
+NORMALIZATION_SUFFIX = '.normalization'
 
 RESULT_PATH = os.path.join(PROJECT_PATH, 'result')
 TEST_OUTPUT = os.path.join(RESULT_PATH, "test.output.txt")
+BENCHMARK_OUTPUT = os.path.join(RESULT_PATH, 'benchmark.jsonl')
+
+CACHE_PATH = os.path.join(PROJECT_PATH, 'cache')
 
 MODEL_SAVE_PATH = os.path.join(PROJECT_PATH, 'saved_model')
 PERCEPTRON_MODEL = 'perceptron.model'
 AVERAGE_PERCEPTRON_MODEL = 'perceptron.average.model'
 STRUCTURED_PERCEPTRON_MODEL = 'perceptron.structured.model'
 AVERAGE_STRUCTURED_PERCEPTRON_MODEL = 'perceptron.average.structured.model'
+BUNDLE_SUFFIX = '.bundle'
+CHECKPOINT_SUFFIX = '.checkpoint'
 
 if not os.path.exists(MODEL_SAVE_PATH):
     os.mkdir(MODEL_SAVE_PATH)
 if not os.path.exists(RESULT_PATH):
     os.mkdir(RESULT_PATH)
+if not os.path.exists(CACHE_PATH):
+    os.mkdir(CACHE_PATH)
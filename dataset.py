@@ -7,6 +7,17 @@
 
 from constant import *
 from vocab import Vocab
+from cache import FeatureCache
+from templates import compile_templates
+from normalize import compile_normalizer
+from output import open_text
+
+import hashlib
+import multiprocessing
+import queue
+import threading
+
+import numpy as np
 
 
 class Dataset(object):
@@ -14,133 +25,241 @@ class Dataset(object):
     A dataset with formatted contents, used for train and test
     """
 
-    def __init__(self, name):
+    def __init__(self, name, stream=False, cache=False, vocab=None, grow=False, normalization=None, data_path=None,
+                 extractors=0):
         """
         Initialize the dataset: generate/load vocabulary, generate features
-        :param name: name of dataset, should be 'train' or 'test' or 'keyboard'
+        :param name: name of dataset, should be 'train' or 'test' or 'dev' or 'update' or 'keyboard'
+        :param stream: do not keep features in memory, sentences are generated lazily when iterating
+        :param cache: load features from the on-disk feature cache, build it if not valid
+        :param vocab: use this vocabulary instead of loading it from disk
+        :param grow: append new features of the data file to a loaded vocabulary, existing indexes are kept
+        :param normalization: normalization steps applied before feature extraction,
+                              default are the steps given to *set_normalization*
+        :param data_path: read this file instead of the default data file of *name*,
+                          '-' means stdin and a '.gz' suffix means gzip
+        :param extractors: if positive, features are not extracted when initialized but by this number of processes
+                           during the first pass over the dataset, see *pipeline*. Streamed datasets extract
+                           features with them on every pass, and a feature cache is built with them
         """
-        # Open data file
+        # Path of data file
+        self.data_path = None
         if name == 'train':
-            self.data_file = open(TRAIN_DATA, 'r')
+            self.data_path = TRAIN_DATA
         elif name == 'test':
-            self.data_file = open(TEST_DATA, 'r')
+            self.data_path = TEST_DATA
+        elif name == 'dev':
+            self.data_path = DEV_DATA
+        elif name == 'update':
+            self.data_path = UPDATE_DATA
+        if data_path is not None:
+            self.data_path = data_path
+        self.stream = stream
+        self.extractors = extractors
+        self.normalization = normalization_steps
+        self.extract_keys = extract_keys
+        if normalization is not None:
+            self.normalization = list(normalization)
+            self.extract_keys = compile_templates(FEATURE_TEMPLATES, compile_normalizer(normalization))
 
         # Generate vocabulary, features, labels and words
-        self.vocab = Vocab([UNKNOWN])
+        self.vocab = Vocab([UNKNOWN]) if vocab is None else vocab
 
         # Load vocabulary if vocab exists
-        self.vocab_loaded = False
-        if os.path.exists(VOCAB_PATH):
+        self.vocab_loaded = vocab is not None
+        if vocab is None and os.path.exists(VOCAB_PATH):
             self.vocab_loaded = True
             vocab_file = open(VOCAB_PATH, 'r')
-            for line in vocab_file:
-                self.vocab.add(line.strip())
+            old_layout = True
+            for i, line in enumerate(vocab_file):
+                key = line.strip()
+                # Keys of the old layout end with the label, "1_^_0" and "1_^_1" instead of "1_^"
+                if i > 0 and not key.endswith(('_0', '_1')):
+                    old_layout = False
+                self.vocab.add(key)
             vocab_file.close()
+            if old_layout and self.vocab.size() > 1:
+                raise ValueError('Vocabulary %s has an old layout with a feature per label, remove it to regenerate '
+                                 'it and retrain the models' % VOCAB_PATH)
+            check_normalization('Vocabulary %s' % VOCAB_PATH, load_normalization(VOCAB_PATH), self.normalization)
+
+        # A vocabulary of a model bundle knows the normalization steps it was built with
+        if getattr(vocab, 'normalization', None) is not None:
+            check_normalization('Model bundle', vocab.normalization, self.normalization)
 
         # Return if keyboard test
         if name == 'keyboard':
             return
 
-        self.features = list()
-        self.labels = list()
-        self.words = list()
-
-        for line in self.data_file:
-            sentence_features = list()  # features of this sentence
-            sentence_label = list()  # labels of this sentence
-
-            self.words.append(line.split())  # separated words of this sentence
-            text = '^' + line.strip() + '$'  # add begin and end mark
-            length = len(text)
-            for i in range(length):
-                # Ignore empty chars and specific chars
-                if text[i] == ' ' or text[i] == '^' or text[i] == '$':
-                    continue
-
-                # Get label of this character
-                if text[i + 1] in SPACE or text[i + 1] == '$':
-                    label = 1
-                else:
-                    label = 0
-
-                # Get prev and next character
-                prev = i - 1
-                next = i + 1
-                while text[prev] in SPACE:
-                    prev -= 1
-                while text[next] in SPACE:
-                    next += 1
-
-                # Add label
-                sentence_label.append(label)
-
-                # Add feature
-                if not self.vocab_loaded:
-                    # Vocab is not loaded, we need to add features into vocabulary and get indexes
-                    sentence_features.append(((
-                                                  # Uni-gram, with label 0
-                                                  self.vocab.add('_'.join((str(1), text[prev], str(0)))),
-                                                  self.vocab.add(('_'.join((str(2), text[i], str(0))))),
-                                                  self.vocab.add(('_'.join((str(3), text[next], str(0))))),
-
-                                                  # Bi-gram, with label 0
-                                                  self.vocab.add('_'.join((str(4), text[prev], text[i], str(0)))),
-                                                  self.vocab.add('_'.join((str(5), text[i], text[next], str(0)))),
-                                                  self.vocab.add('_'.join((str(6), text[prev], text[next], str(0)))),
-
-                                                  # Tri-gram, with label 0
-                                                  self.vocab.add(
-                                                      '_'.join((str(7), text[prev], text[i], text[next], str(0))))
-                                              ), (
-                                                  # Uni-gram, with label 1
-                                                  self.vocab.add('_'.join((str(1), text[prev], str(1)))),
-                                                  self.vocab.add(('_'.join((str(2), text[i], str(1))))),
-                                                  self.vocab.add(('_'.join((str(3), text[next], str(1))))),
-
-                                                  # Bi-gram, with label 1
-                                                  self.vocab.add('_'.join((str(4), text[prev], text[i], str(1)))),
-                                                  self.vocab.add('_'.join((str(5), text[i], text[next], str(1)))),
-                                                  self.vocab.add('_'.join((str(6), text[prev], text[next], str(1)))),
-
-                                                  # Tri-gram, with label 1
-                                                  self.vocab.add(
-                                                      '_'.join((str(7), text[prev], text[i], text[next], str(1))))
-                                              )))
-                else:
-                    # Vocab loaded, we only need to get indexes from vocabulary
-                    sentence_features.append(((
-                                                  # Uni-gram, with label 0
-                                                  self.vocab.get_index('_'.join((str(1), text[prev], str(0)))),
-                                                  self.vocab.get_index(('_'.join((str(2), text[i], str(0))))),
-                                                  self.vocab.get_index(('_'.join((str(3), text[next], str(0))))),
-
-                                                  # Bi-gram, with label 0
-                                                  self.vocab.get_index('_'.join((str(4), text[prev], text[i], str(0)))),
-                                                  self.vocab.get_index('_'.join((str(5), text[i], text[next], str(0)))),
-                                                  self.vocab.get_index(
-                                                      '_'.join((str(6), text[prev], text[next], str(0)))),
-
-                                                  # Tri-gram, with label 0
-                                                  self.vocab.get_index(
-                                                      '_'.join((str(7), text[prev], text[i], text[next], str(0))))
-                                              ), (
-                                                  # Uni-gram, with label 1
-                                                  self.vocab.get_index('_'.join((str(1), text[prev], str(1)))),
-                                                  self.vocab.get_index(('_'.join((str(2), text[i], str(1))))),
-                                                  self.vocab.get_index(('_'.join((str(3), text[next], str(1))))),
-
-                                                  # Bi-gram, with label 1
-                                                  self.vocab.get_index('_'.join((str(4), text[prev], text[i], str(1)))),
-                                                  self.vocab.get_index('_'.join((str(5), text[i], text[next], str(1)))),
-                                                  self.vocab.get_index(
-                                                      '_'.join((str(6), text[prev], text[next], str(1)))),
-
-                                                  # Tri-gram, with label 1
-                                                  self.vocab.get_index(
-                                                      '_'.join((str(7), text[prev], text[i], text[next], str(1))))
-                                              )))
-            self.labels.append(sentence_label)
-            self.features.append(sentence_features)
+        # Build vocabulary with a separate pass over the data file
+        if not self.vocab_loaded or grow:
+            self.build_vocab()
+
+        # Load features from cache, extract features only if the cache is not valid
+        self.cache = None
+        if cache:
+            feature_cache = FeatureCache(get_cache_name(name, data_path), self.data_path, self.vocab,
+                                         self.normalization)
+            if not feature_cache.exists():
+                sentences = self.pipeline() if extractors > 0 else self.generate()
+                feature_cache.build((features, labels) for features, labels, words in sentences)
+            feature_cache.load()
+            self.cache = feature_cache
+
+        # Keep nothing else in memory if streaming
+        if self.stream:
+            return
+
+        # Features and labels of all sentences are packed into flat arrays, the cache is used without copying
+        # Words are rebuilt from a single string of each sentence and its labels
+        if self.cache is not None:
+            self.features = RaggedArray(self.cache.features, self.cache.offsets)
+            self.labels = RaggedArray(self.cache.labels, self.cache.offsets)
+            data_file = open_text(self.data_path, 'r')
+            self.words = SentenceWords([''.join(line.split()) for line in data_file], self.labels)
+            data_file.close()
+            return
+
+        # With extraction workers, features are extracted during the first pass instead of now
+        self.features = None
+        self.labels = None
+        self.words = None
+        if extractors <= 0:
+            for sentence in self.keep(self.generate()):
+                pass
+
+    def keep(self, sentences):
+        """
+        Pass sentences through and keep them in memory, they are packed once all sentences have passed
+        :param sentences: an iterable of (features, labels, words) of all sentences of the data file
+        :return: a generator of (features, labels, words), features and labels are arrays
+        """
+        features = list()
+        labels = list()
+        texts = list()
+        for sentence_features, sentence_labels, words in sentences:
+            sentence_features = np.asarray(sentence_features, dtype=np.int32).reshape(-1, len(FEATURE_TEMPLATES))
+            sentence_labels = np.asarray(sentence_labels, dtype=np.uint8)
+            features.append(sentence_features)
+            labels.append(sentence_labels)
+            texts.append(''.join(words))
+            yield sentence_features, sentence_labels, words
+        self.features = RaggedArray.pack(features, (0, len(FEATURE_TEMPLATES)), np.int32)
+        self.labels = RaggedArray.pack(labels, (0,), np.uint8)
+        self.words = SentenceWords(texts, self.labels)
+
+    def pipeline(self):
+        """
+        Extract features in worker processes while sentences are consumed: a reader thread sends batches of lines
+        to the workers and queues their pending results, the queue is bounded so reading stops when the consumer
+        falls behind. Sentences come out in the order of the data file
+        :return: a generator of (features, labels, words)
+        """
+        pending = queue.Queue(PIPELINE_DEPTH)
+        stopped = threading.Event()
+        pool = get_fork_context().Pool(self.extractors, _init_extractor, (self,))
+
+        def read():
+            # Errors of reading are passed to the consumer, which would wait for the end of queue forever otherwise
+            try:
+                data_file = open_text(self.data_path, 'r')
+                try:
+                    for lines in batched(data_file, PIPELINE_BATCH_SIZE):
+                        if stopped.is_set():
+                            break
+                        pending.put(pool.apply_async(_extract_lines, (lines,)))
+                finally:
+                    data_file.close()
+            except Exception as error:
+                pending.put(error)
+            finally:
+                pending.put(None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            while True:
+                result = pending.get()
+                if result is None:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                for sentence in result.get():
+                    yield sentence
+        finally:
+            # Unblock the reader if the consumer stops early
+            stopped.set()
+            while reader.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            pool.terminate()
+
+    def load(self):
+        """
+        Extract features of all sentences if they are not extracted yet
+        :return: None
+        """
+        if not self.stream and self.features is None:
+            for sentence in self.keep(self.pipeline()):
+                pass
+
+    def build_vocab(self):
+        """
+        Add all features of the data file into vocabulary
+        :return: None
+        """
+        data_file = open_text(self.data_path, 'r')
+        for line in data_file:
+            self.parse_line(line, build=True)
+        data_file.close()
+
+    def generate(self, shard=0, shards=1):
+        """
+        Generate features, labels and words of each sentence in the data file lazily
+        :param shard: index of shard to be generated
+        :param shards: number of shards, the *i*-th sentence belongs to shard *i % shards*
+        :return: a generator of (features, labels, words)
+        """
+        data_file = open_text(self.data_path, 'r')
+        for i, line in enumerate(data_file):
+            if i % shards != shard:
+                continue
+            if self.cache is not None:
+                features, labels = self.cache[i]
+                yield features, labels, line.split()
+            else:
+                yield self.parse_line(line)
+        data_file.close()
+
+    def shard(self, shard, shards):
+        """
+        Iterate over a shard of the dataset
+        :param shard: index of shard
+        :param shards: number of shards, the *i*-th sentence belongs to shard *i % shards*
+        :return: an iterator of (features, labels, words)
+        """
+        if self.stream:
+            return self.generate(shard, shards)
+        return zip(self.features[shard::shards], self.labels[shard::shards], self.words[shard::shards])
+
+    def parse_line(self, line, build=False):
+        """
+        Generate features and labels of a line in the data file
+        :param line: a line of separated words
+        :param build: add features into vocabulary, otherwise only get indexes from vocabulary
+        :return: a tuple of (features, labels, words) of this sentence
+        """
+        words = line.split()  # separated words of this sentence
+
+        # The last character of a word is labeled 1, others are labeled 0
+        sentence_label = list()
+        for word in words:
+            sentence_label.extend([0] * (len(word) - 1))
+            sentence_label.append(1)
+
+        return self.generate_features(''.join(words), build=build), sentence_label, words
 
     def show_vocab(self):
         """
@@ -152,7 +271,7 @@ class Dataset(object):
 
     def save_vocab(self, path):
         """
-        Save vocabulary into a file
+        Save vocabulary into a file, and its normalization steps into the file with *NORMALIZATION_SUFFIX*
         :param path: save path
         :return: None
         """
@@ -161,52 +280,258 @@ class Dataset(object):
             file.write(self.vocab.get_word(i) + '\n')
         file.close()
 
+        # Normalization steps are saved along, features of the vocabulary are only valid under them
+        file = open(path + NORMALIZATION_SUFFIX, 'w')
+        file.write(','.join(self.normalization) + '\n')
+        file.close()
+
+    def generate_feature_chunks(self, text, size=CHUNK_SIZE):
+        """
+        Generate features for a long input text lazily, *size* characters at a time
+        :param text: input text
+        :param size: number of characters of each chunk
+        :return: a generator of lists of features
+        """
+        for begin in range(0, len(text), size):
+            yield self.generate_features(text, begin, min(begin + size, len(text)))
+
     def __len__(self):
         return len(self.labels)
 
     def __getitem__(self, item):
         return self.features[item], self.labels[item], self.words[item]
 
-    def generate_features(self, text):
+    def __iter__(self):
+        if self.stream:
+            return self.pipeline() if self.extractors > 0 and self.cache is None else self.generate()
+        if self.features is None:
+            return self.keep(self.pipeline())
+        return zip(self.features, self.labels, self.words)
+
+    def generate_features(self, text, begin=0, end=None, build=False):
         """
         Generate features for a input sentence
         :param text: input sentence
-        :return: list of features of *test*
+        :param begin: generate features from this character on
+        :param end: generate features until this character, default is the end of *text*
+        :param build: add features into vocabulary, otherwise only get indexes from vocabulary
+        :return: list of features of *test*, a tuple of feature indexes for each character
         """
-        text = '^' + text + '$'
+        if build:
+            columns = [list(map(self.vocab.add, keys)) for keys in self.extract_keys(text, begin, end)]
+        else:
+            # Keys of all templates are looked up in one call
+            keys = self.extract_keys(text, begin, end)
+            indexes = self.vocab.get_indexes([key for column in keys for key in column])
+            length = len(indexes) // len(keys)
+            columns = [indexes[k * length:(k + 1) * length] for k in range(len(keys))]
+        return list(zip(*columns))
 
-        features = list()
-        for i in range(1, len(text) - 1):
-            prev = i - 1
-            next = i + 1
-            features.append(((
-                                 self.vocab.get_index('_'.join((str(1), text[prev], str(0)))),
-                                 self.vocab.get_index(('_'.join((str(2), text[i], str(0))))),
-                                 self.vocab.get_index(('_'.join((str(3), text[next], str(0))))),
-
-                                 # Bi-gram, with label 0
-                                 self.vocab.get_index('_'.join((str(4), text[prev], text[i], str(0)))),
-                                 self.vocab.get_index('_'.join((str(5), text[i], text[next], str(0)))),
-                                 self.vocab.get_index(
-                                     '_'.join((str(6), text[prev], text[next], str(0)))),
-
-                                 # Tri-gram, with label 0
-                                 self.vocab.get_index(
-                                     '_'.join((str(7), text[prev], text[i], text[next], str(0))))
-                             ), (
-                                 # Uni-gram, with label 1
-                                 self.vocab.get_index('_'.join((str(1), text[prev], str(1)))),
-                                 self.vocab.get_index(('_'.join((str(2), text[i], str(1))))),
-                                 self.vocab.get_index(('_'.join((str(3), text[next], str(1))))),
-
-                                 # Bi-gram, with label 1
-                                 self.vocab.get_index('_'.join((str(4), text[prev], text[i], str(1)))),
-                                 self.vocab.get_index('_'.join((str(5), text[i], text[next], str(1)))),
-                                 self.vocab.get_index(
-                                     '_'.join((str(6), text[prev], text[next], str(1)))),
-
-                                 # Tri-gram, with label 1
-                                 self.vocab.get_index(
-                                     '_'.join((str(7), text[prev], text[i], text[next], str(1))))
-                             )))
-        return features
+
+# Dataset of an extraction worker process, inherited from the parent process when forked
+_extractor_state = dict()
+
+
+def _init_extractor(dataset):
+    """
+    Keep dataset in an extraction worker process
+    :param dataset: dataset whose vocabulary is used to generate features
+    :return: None
+    """
+    _extractor_state['dataset'] = dataset
+
+
+def _extract_lines(lines):
+    """
+    Generate features and labels of lines in an extraction worker process
+    :param lines: a list of lines of separated words
+    :return: a list of (features, labels, words), features and labels are arrays which are cheap to send back
+    """
+    sentences = list()
+    for line in lines:
+        features, labels, words = _extractor_state['dataset'].parse_line(line)
+        sentences.append((np.asarray(features, dtype=np.int32).reshape(-1, len(FEATURE_TEMPLATES)),
+                          np.asarray(labels, dtype=np.uint8), words))
+    return sentences
+
+
+def get_fork_context():
+    """
+    Get a multiprocessing context which forks worker processes if possible,
+    so that vocabulary, dataset and weights are shared with workers instead of being pickled
+    :return: a multiprocessing context
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+class RaggedArray(object):
+    """
+    A list of arrays of different lengths stored as one flat array and the offsets of rows,
+    every item is a view of the flat array
+    """
+
+    def __init__(self, values, offsets):
+        """
+        Initialize the array
+        :param values: flat array of all rows concatenated
+        :param offsets: int64 array of *len + 1* offsets, row *i* is values[offsets[i]:offsets[i + 1]]
+        """
+        self.values = values
+        self.offsets = offsets
+
+    @staticmethod
+    def pack(rows, empty_shape, dtype):
+        """
+        Pack arrays into a RaggedArray
+        :param rows: a list of arrays
+        :param empty_shape: shape of the flat array if there is no row
+        :param dtype: type of values
+        :return: a RaggedArray
+        """
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(row) for row in rows])
+        values = np.concatenate(rows).astype(dtype, copy=False) if rows else np.zeros(empty_shape, dtype=dtype)
+        return RaggedArray(values, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        return self.values[self.offsets[item]:self.offsets[item + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class SentenceWords(object):
+    """
+    Words of sentences, split from the string of each sentence by its labels when accessed
+    """
+
+    def __init__(self, texts, labels):
+        """
+        Initialize the words
+        :param texts: a list of strings of sentences
+        :param labels: labels of each sentence, 1 means a word ends at this character
+        """
+        self.texts = texts
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        text = self.texts[item]
+        ends = (np.flatnonzero(self.labels[item]) + 1).tolist()
+        return [text[begin:end] for begin, end in zip([0] + ends, ends)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# Feature keys of all templates are extracted by a single compiled function
+normalization_steps = list(NORMALIZATION)
+extract_keys = compile_templates(FEATURE_TEMPLATES, compile_normalizer(normalization_steps))
+
+
+def set_normalization(steps):
+    """
+    Set the normalization steps of datasets created afterwards, they must be the same when a vocabulary is built
+    and whenever it is used
+    :param steps: names of normalization steps, see normalize.py
+    :return: None
+    """
+    global normalization_steps, extract_keys
+    normalization_steps = list(steps)
+    extract_keys = compile_templates(FEATURE_TEMPLATES, compile_normalizer(normalization_steps))
+
+
+def load_normalization(vocab_path):
+    """
+    Load the normalization steps a vocabulary was built with,
+    vocabularies saved without their steps were built without normalization
+    :param vocab_path: path of vocabulary
+    :return: a list of names of normalization steps
+    """
+    saved = list()
+    if os.path.exists(vocab_path + NORMALIZATION_SUFFIX):
+        file = open(vocab_path + NORMALIZATION_SUFFIX, 'r')
+        saved = [step for step in file.read().strip().split(',') if step]
+        file.close()
+    return saved
+
+
+def check_normalization(source, saved, steps):
+    """
+    Check that a vocabulary was built with the normalization steps in use
+    :param source: description of vocabulary, used in the error message
+    :param saved: normalization steps the vocabulary was built with
+    :param steps: normalization steps in use
+    :return: None
+    """
+    if list(saved) != list(steps):
+        raise ValueError('%s was built with normalization steps [%s] but [%s] are used, normalize with the same '
+                         'steps or regenerate the vocabulary and retrain the models'
+                         % (source, ','.join(saved), ','.join(steps)))
+
+
+def get_cache_name(name, data_path=None):
+    """
+    Get the name of the feature cache of a dataset, a data file other than the default one of *name* gets a cache
+    of its own, so building it never removes the cache of the default file
+    :param name: name of dataset
+    :param data_path: path of data file if it is not the default one
+    :return: name of feature cache
+    """
+    if data_path is None:
+        return name
+    return '%s-%s' % (name, hashlib.sha1(os.path.abspath(data_path).encode('utf-8')).hexdigest()[:8])
+
+
+def batched(iterable, size):
+    """
+    Split an iterable into lists of at most *size* items
+    :param iterable: any iterable
+    :param size: max size of each list
+    :return: a generator of lists
+    """
+    batch = list()
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = list()
+    if len(batch) > 0:
+        yield batch
+
+
+def split_safe(text, max_length=CHUNK_SIZE):
+    """
+    Split a long text into pieces ending with sentence-final punctuation, each not longer than *max_length* if possible.
+    A piece without such punctuation in *max_length* characters is kept whole
+    :param text: input text
+    :param max_length: preferred max length of pieces
+    :return: a list of (begin, end) of pieces
+    """
+    pieces = list()
+    begin = 0
+    last_safe = None
+    for i in range(len(text)):
+        if text[i] in SENTENCE_END:
+            last_safe = i + 1
+        if i + 1 - begin > max_length and last_safe is not None and last_safe > begin:
+            pieces.append((begin, last_safe))
+            begin = last_safe
+    if begin < len(text):
+        pieces.append((begin, len(text)))
+    return pieces
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: evaluate.py
+# @Project: ZHWordSegmentation
+
+import gzip
+
+
+def get_offsets(pred):
+    """
+    Get character offsets of words by predicted boundaries
+    :param pred: 0/1 predictions of each character, 1 means a word ends at this character
+    :return: a list of (begin, end) of each word
+    """
+    offsets = list()
+    begin = 0
+    for i in range(len(pred)):
+        if pred[i] == 1:
+            offsets.append((begin, i + 1))
+            begin = i + 1
+    if begin < len(pred):
+        offsets.append((begin, len(pred)))
+    return offsets
+
+
+def get_words(sentence, pred):
+    """
+    Split a sentence into words by predicted boundaries
+    :param sentence: string of a sentence
+    :param pred: 0/1 predictions of each character, 1 means a word ends at this character
+    :return: a list of words
+    """
+    return [sentence[begin:end] for begin, end in get_offsets(pred)]
+
+
+def get_spans(words):
+    """
+    Get character spans of words
+    :param words: a list of words
+    :return: a set of (begin, end) of each word
+    """
+    spans = set()
+    begin = 0
+    for word in words:
+        spans.add((begin, begin + len(word)))
+        begin += len(word)
+    return spans
+
+
+def score(pred_sentences, gold_sentences, dictionary=None):
+    """
+    Compute precision, recall, F-score and OOV/IV recall of segmented sentences
+    :param pred_sentences: an iterable of predicted word lists
+    :param gold_sentences: an iterable of gold word lists
+    :param dictionary: a set of words seen in train dataset, OOV/IV recall is None if not given or if gold
+    sentences have no OOV/IV words
+    :return: a tuple of (precision, recall, f, oov recall, iv recall)
+    """
+    correct = pred_count = gold_count = 0
+    oov_correct = oov_count = iv_correct = iv_count = 0
+    for pred_words, gold_words in zip(pred_sentences, gold_sentences):
+        pred_spans = get_spans(pred_words)
+        gold_spans = get_spans(gold_words)
+        correct += len(pred_spans & gold_spans)
+        pred_count += len(pred_spans)
+        gold_count += len(gold_spans)
+
+        if dictionary is not None:
+            begin = 0
+            for word in gold_words:
+                found = (begin, begin + len(word)) in pred_spans
+                if word in dictionary:
+                    iv_correct += found
+                    iv_count += 1
+                else:
+                    oov_correct += found
+                    oov_count += 1
+                begin += len(word)
+
+    precision = correct / pred_count if pred_count > 0 else 0.0
+    recall = correct / gold_count if gold_count > 0 else 0.0
+    f = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    oov_recall = iv_recall = None
+    if dictionary is not None:
+        oov_recall = oov_correct / oov_count if oov_count > 0 else None
+        iv_recall = iv_correct / iv_count if iv_count > 0 else None
+    return precision, recall, f, oov_recall, iv_recall
+
+
+def load_words(path):
+    """
+    Load segmented sentences of a file
+    :param path: path of a file with words separated by spaces, gzip compressed if it ends with '.gz'
+    :return: a list of word lists
+    """
+    file = gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, 'r')
+    sentences = [line.split() for line in file]
+    file.close()
+    return sentences
+
+
+def load_dictionary(path):
+    """
+    Load the set of words of a segmented file
+    :param path: path of a file with words separated by spaces
+    :return: a set of words
+    """
+    dictionary = set()
+    file = open(path, 'r')
+    for line in file:
+        dictionary.update(line.split())
+    file.close()
+    return dictionary
+
+
+def format_recall(recall):
+    """
+    Format an OOV/IV recall of *score*
+    :param recall: recall, or None if there are no such words
+    :return: recall with 4 decimals, or 'n/a'
+    """
+    return 'n/a' if recall is None else '%.4f' % recall
+
+
+def print_score(result):
+    """
+    Print a result of *score*, OOV/IV recall is printed as 'n/a' if there are no such words
+    :param result: a tuple of (precision, recall, f, oov recall, iv recall)
+    :return: None
+    """
+    precision, recall, f, oov_recall, iv_recall = result
+    if oov_recall is None and iv_recall is None:
+        print('P %.4f  R %.4f  F %.4f' % (precision, recall, f))
+    else:
+        print('P %.4f  R %.4f  F %.4f  OOV-R %s  IV-R %s'
+              % (precision, recall, f, format_recall(oov_recall), format_recall(iv_recall)))
+
+
+class EarlyStopping(object):
+    """
+    Stop training once F-score on dev dataset stops improving
+    """
+
+    def __init__(self, patience, delta=0.0):
+        """
+        Initialize the early stopping
+        :param patience: number of epochs without improvement before stopping
+        :param delta: least increase of F-score counted as an improvement
+        """
+        self.patience = patience
+        self.delta = delta
+        self.best = None
+        self.bad_epochs = 0
+
+    def update(self, f):
+        """
+        Record F-score of an epoch
+        :param f: F-score on dev dataset
+        :return: True if *f* is the best F-score so far
+        """
+        if self.best is None or f > self.best + self.delta:
+            self.best = f
+            self.bad_epochs = 0
+            return True
+        self.bad_epochs += 1
+        return False
+
+    def stop(self):
+        """
+        Check whether training should stop
+        :return: True if F-score has not improved for *patience* epochs
+        """
+        return self.bad_epochs >= self.patience
+
+    def get_state(self):
+        """
+        Get the state of the early stopping, saved with checkpoints
+        :return: a dict of best F-score and number of epochs without improvement
+        """
+        return {'best': self.best, 'bad_epochs': self.bad_epochs}
+
+    def set_state(self, state):
+        """
+        Restore the state of the early stopping
+        :param state: a dict returned by *get_state*
+        :return: None
+        """
+        self.best = state['best']
+        self.bad_epochs = state['bad_epochs']
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: lexicon.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+
+import array
+import collections
+
+# Transitions of all states are kept in one dict keyed by state * CHAR_RANGE + code point of character
+CHAR_RANGE = 0x110000
+
+
+class Lexicon(object):
+    """
+    A user lexicon of words which must never be split, matched with an Aho-Corasick automaton
+    so that all matches in a text are found in one pass
+    """
+
+    def __init__(self, words=None):
+        """
+        Initialize the lexicon
+        :param words: an iterable of words
+        """
+        self.goto = dict()
+        self.length = array.array('i', [0])  # length of the word ending at each state, 0 if none
+        self.fail = array.array('i', [0])
+        self.output = array.array('i', [0])  # next state on the fail chain where a word ends
+        self.children = [[]]
+        self.built = False
+
+        if words is not None:
+            for word in words:
+                self.add(word)
+            self.build()
+
+    def size(self):
+        """
+        Get the number of words in the lexicon
+        :return: number of words
+        """
+        return sum(1 for length in self.length if length > 0)
+
+    def add(self, word):
+        """
+        Add a word into the trie, *build* must be called after all words are added
+        :param word: string of word
+        :return: None
+        """
+        state = 0
+        for char in word:
+            key = state * CHAR_RANGE + ord(char)
+            child = self.goto.get(key)
+            if child is None:
+                child = len(self.length)
+                self.goto[key] = child
+                self.length.append(0)
+                self.fail.append(0)
+                self.output.append(0)
+                self.children[state].append((char, child))
+                self.children.append([])
+            state = child
+        if state > 0:
+            self.length[state] = len(word)
+        self.built = False
+
+    def build(self):
+        """
+        Compute fail links and output links by a breadth-first traversal of the trie
+        :return: None
+        """
+        queue = collections.deque(child for char, child in self.children[0])
+        for child in queue:
+            self.fail[child] = 0
+        while queue:
+            state = queue.popleft()
+            for char, child in self.children[state]:
+                fail = self.fail[state]
+                while fail > 0 and fail * CHAR_RANGE + ord(char) not in self.goto:
+                    fail = self.fail[fail]
+                fail = self.goto.get(fail * CHAR_RANGE + ord(char), 0)
+                self.fail[child] = fail
+                self.output[child] = fail if self.length[fail] > 0 else self.output[fail]
+                queue.append(child)
+        self.built = True
+
+    def find(self, text):
+        """
+        Find all occurrences of words of the lexicon in a text
+        :param text: input text
+        :return: a generator of (begin, end) of matches, ordered by end
+        """
+        if not self.built:
+            self.build()
+
+        state = 0
+        for i, char in enumerate(text):
+            code = ord(char)
+            while state > 0 and state * CHAR_RANGE + code not in self.goto:
+                state = self.fail[state]
+            state = self.goto.get(state * CHAR_RANGE + code, 0)
+
+            match = state if self.length[state] > 0 else self.output[state]
+            while match > 0:
+                yield i + 1 - self.length[match], i + 1
+                match = self.output[match]
+
+    def match(self, text):
+        """
+        Find words of the lexicon in a text, matches are chosen leftmost-longest and never overlap
+        :param text: input text
+        :return: a list of (begin, end) of chosen matches
+        """
+        longest = [0] * len(text)
+        for begin, end in self.find(text):
+            if end > longest[begin]:
+                longest[begin] = end
+
+        words = list()
+        i = 0
+        while i < len(text):
+            end = longest[i]
+            if end == 0:
+                i += 1
+                continue
+            words.append((i, end))
+            i = end
+        return words
+
+    def get_constraints(self, text):
+        """
+        Get forced labels of a text, matches are chosen leftmost-longest and never overlap
+        :param text: input text
+        :return: a list of forced label of each character, -1 if it is not forced
+        """
+        constraints = [-1] * len(text)
+        for begin, end in self.match(text):
+            # No boundary inside the word, boundaries before and after it
+            for j in range(begin, end - 1):
+                constraints[j] = 0
+            constraints[end - 1] = 1
+            if begin > 0:
+                constraints[begin - 1] = 1
+        return constraints
+
+    def get_chunk_constraints(self, text, size=CHUNK_SIZE):
+        """
+        Get forced labels of a long text lazily, *size* characters at a time. Each chunk is matched together with
+        the following characters up to the length of the longest word, and matching resumes from the word crossing
+        the end of the chunk, so the result is exactly the same as *get_constraints*
+        :param text: input text
+        :param size: number of characters of each chunk
+        :return: a generator of lists of forced labels, concatenated they are the forced labels of *text*
+        """
+        overlap = max(self.length)
+        start = 0  # matching resumes here, never inside a chosen word
+        for begin in range(0, len(text), size):
+            end = min(begin + size, len(text))
+            constraints = [-1] * (end - begin)
+            resume = end
+            for word_begin, word_end in self.match(text[start:end + overlap]):
+                word_begin, word_end = word_begin + start, word_end + start
+                if word_begin > end:
+                    break
+                if word_end > end > word_begin:
+                    resume = word_begin
+                for j in range(max(word_begin, begin), min(word_end - 1, end)):
+                    constraints[j - begin] = 0
+                if begin <= word_end - 1 < end:
+                    constraints[word_end - 1 - begin] = 1
+                if begin <= word_begin - 1 < end:
+                    constraints[word_begin - 1 - begin] = 1
+            start = resume
+            yield constraints
+
+
+def load_lexicon(path):
+    """
+    Load a user lexicon file, the first column of each line is a word, other columns like frequency are ignored
+    :param path: path of lexicon file
+    :return: a Lexicon
+    """
+    file = open(path, 'r')
+    words = [line.split()[0] for line in file if line.strip()]
+    file.close()
+
+    lexicon = Lexicon(words)
+    print('Lexicon of', len(words), 'words loaded from path', path)
+    return lexicon
@@ -6,10 +6,21 @@
 # @Project: ZHWordSegmentation
 
 from train_test import *
+from dataset import set_normalization
+from server import serve
+from metrics import Metrics
 from optparse import OptionParser
 
+import sys
+
 # Parse command line arguments
-parser = OptionParser(usage='Usage: python %prog [-s] [-a] [-t [ -o <filename>] | -k]')
+parser = OptionParser(usage='Usage: python %prog [-s] [-a] [--stream] [--cache] [-b] [-w <workers>] [-x <extractors>] '
+                            '[-r | -u] [-m <filename>] [-l <filename>] [--result-cache <size>] [--normalize <steps>] '
+                            '[-t [-i <filename>] [-o <filename>] [-f <format>] | -k | '
+                            '-e [--threshold <value>] [--bits <bits>] | '
+                            '--prune-report | --quantize-report | --normalize-report | '
+                            '--serve [--port <port> | --unix-socket <path>] '
+                            '[--serve-batch <size>] [--max-wait <seconds>]]')
 parser.add_option('-s', '--structured',
                   action='store_true',
                   dest='structured',
@@ -30,15 +41,161 @@ parser.add_option('-o', '--output',
                   dest='outputfile',
                   type='string',
                   default=TEST_OUTPUT,
-                  help='Output test result into OUTPUTFILE')
+                  help='Output test result into OUTPUTFILE, - means stdout and a .gz suffix means gzip')
+parser.add_option('-i', '--input',
+                  action='store',
+                  dest='inputfile',
+                  type='string',
+                  help='Segment INPUTFILE instead of test dataset, - means stdin and a .gz suffix means gzip')
+parser.add_option('-f', '--format',
+                  action='store',
+                  dest='outputformat',
+                  type='choice',
+                  choices=OUTPUT_FORMATS,
+                  default='plain',
+                  help='Output test result as plain words, word offsets or JSON lines, one of %s' % ', '.join(
+                      OUTPUT_FORMATS))
+parser.add_option('-w', '--workers',
+                  action='store',
+                  dest='workers',
+                  type='int',
+                  default=1,
+                  help='Train or test with WORKERS processes')
+parser.add_option('-x', '--extractors',
+                  action='store',
+                  dest='extractors',
+                  type='int',
+                  default=0,
+                  help='Extract features of train dataset with EXTRACTORS processes while the first epoch is trained, '
+                       'while every epoch is trained with --stream, or while the feature cache is built with --cache')
+parser.add_option('--stream',
+                  action='store_true',
+                  dest='stream',
+                  help='Read dataset lazily instead of keeping it in memory'
+                  )
+parser.add_option('--cache',
+                  action='store_true',
+                  dest='cache',
+                  help='Load features from the on-disk feature cache'
+                  )
+parser.add_option('-r', '--resume',
+                  action='store_true',
+                  dest='resume',
+                  help='Resume training from the checkpoint of selected model'
+                  )
+parser.add_option('-u', '--update',
+                  action='store_true',
+                  dest='update',
+                  help='Continue training selected model on new annotated data, growing the vocabulary'
+                  )
+parser.add_option('-m', '--metrics',
+                  action='store',
+                  dest='metricsfile',
+                  type='string',
+                  help='Append metrics of training or testing into METRICSFILE as JSON lines'
+                  )
+parser.add_option('-l', '--lexicon',
+                  action='store',
+                  dest='lexiconfile',
+                  type='string',
+                  help='Never split words of user lexicon LEXICONFILE when testing, one word per line'
+                  )
+parser.add_option('--result-cache',
+                  action='store',
+                  dest='result_cache',
+                  type='int',
+                  default=0,
+                  help='Cache results of at most RESULT_CACHE recent sentences when testing or serving')
 parser.add_option('-k', '--keyboard',
                   action='store_true',
                   dest='keyboard',
                   help='Run keyboard test on selected model'
                   )
+parser.add_option('-b', '--bundle',
+                  action='store_true',
+                  dest='bundle',
+                  help='Load selected model from its model bundle'
+                  )
+parser.add_option('-e', '--export',
+                  action='store_true',
+                  dest='export',
+                  help='Export selected model into a model bundle'
+                  )
+parser.add_option('--threshold',
+                  action='store',
+                  dest='threshold',
+                  type='float',
+                  help='Drop features whose absolute weight is not above THRESHOLD when exporting'
+                  )
+parser.add_option('--bits',
+                  action='store',
+                  dest='bits',
+                  type='choice',
+                  choices=['32', '16', '8'],
+                  default='32',
+                  help='Store weights as BITS-bit integers when exporting, 32 keeps float weights'
+                  )
+parser.add_option('--prune-report',
+                  action='store_true',
+                  dest='prune_report',
+                  help='Report model size and F-score of selected model at several pruning thresholds'
+                  )
+parser.add_option('--quantize-report',
+                  action='store_true',
+                  dest='quantize_report',
+                  help='Report model size and F-score delta of selected model quantized to 16 and 8 bits'
+                  )
+parser.add_option('--normalize-report',
+                  action='store_true',
+                  dest='normalize_report',
+                  help='Report vocabulary size and model memory of train dataset under character normalization'
+                  )
+parser.add_option('--normalize',
+                  action='store',
+                  dest='normalization',
+                  type='string',
+                  help='Normalize characters by comma separated NORMALIZATION steps before feature extraction, '
+                       'e.g. nfkc,digit,latin, the same steps must be given whenever the vocabulary is used')
+parser.add_option('--serve',
+                  action='store_true',
+                  dest='serve',
+                  help='Serve selected model over HTTP'
+                  )
+parser.add_option('--port',
+                  action='store',
+                  dest='port',
+                  type='int',
+                  default=SERVE_PORT,
+                  help='Serve on PORT')
+parser.add_option('--unix-socket',
+                  action='store',
+                  dest='unix_socket',
+                  type='string',
+                  help='Serve on Unix socket UNIX_SOCKET instead of a TCP port')
+parser.add_option('--serve-batch',
+                  action='store',
+                  dest='serve_batch',
+                  type='int',
+                  default=SERVE_BATCH_SIZE,
+                  help='Segment at most SERVE_BATCH sentences together when serving')
+parser.add_option('--max-wait',
+                  action='store',
+                  dest='max_wait',
+                  type='float',
+                  default=SERVE_MAX_WAIT,
+                  help='Wait at most MAX_WAIT seconds for a batch to be filled when serving')
 
 (options, args) = parser.parse_args()
 
+# Keep stdout for test result, messages go to stderr
+if options.outputfile == '-':
+    sys.stdout = sys.stderr
+metrics = Metrics(options.metricsfile)
+
+# Normalization is applied to every dataset, it must be set before any of them is created
+normalization = options.normalization.split(',') if options.normalization else list()
+set_normalization(normalization)
+
 # Run the program
 if options.structured:
     # Use structured model
@@ -50,13 +207,34 @@ if options.structured:
 
     if options.test:
         # Begin testing
-        structured_test(USE_MODEL, options.outputfile)
+        structured_test(USE_MODEL, options.outputfile, options.stream, options.cache, options.bundle, options.workers,
+                        metrics, options.lexiconfile, options.result_cache, options.outputformat, options.inputfile)
     elif options.keyboard:
         # Begin keyboard test
-        structured_keyboard_test(USE_MODEL)
+        structured_keyboard_test(USE_MODEL, options.bundle, options.lexiconfile, options.result_cache)
+    elif options.export:
+        # Begin exporting
+        export_bundle(USE_MODEL, StructuredPerceptron, options.threshold, int(options.bits))
+    elif options.prune_report:
+        # Begin pruning report
+        prune_report(USE_MODEL, StructuredPerceptron)
+    elif options.quantize_report:
+        # Begin quantization report
+        quantize_report(USE_MODEL, StructuredPerceptron)
+    elif options.normalize_report:
+        # Begin normalization report
+        normalization_report(normalization or None)
+    elif options.serve:
+        # Begin serving
+        serve(USE_MODEL, True, options.bundle, SERVE_HOST, options.port, options.unix_socket,
+              options.serve_batch, options.max_wait, options.lexiconfile, options.result_cache, normalization)
+    elif options.update:
+        # Begin incremental training
+        incremental_train(USE_MODEL, StructuredPerceptron, options.average, options.stream, options.cache, metrics)
     else:
         # Begin training
-        structured_train(USE_MODEL, options.average)
+        structured_train(USE_MODEL, options.average, options.stream, options.cache, options.workers,
+                         options.resume, metrics, options.extractors)
 
 else:
     if options.average:
@@ -68,10 +246,31 @@ else:
 
     if options.test:
         # Begin testing
-        test(USE_MODEL, options.outputfile)
+        test(USE_MODEL, options.outputfile, options.stream, options.cache, options.bundle, options.workers, metrics,
+             options.lexiconfile, options.result_cache, options.outputformat, options.inputfile)
     elif options.keyboard:
         # Begin keyboard test
-        keyboard_test(USE_MODEL)
+        keyboard_test(USE_MODEL, options.bundle, options.lexiconfile, options.result_cache)
+    elif options.export:
+        # Begin exporting
+        export_bundle(USE_MODEL, Perceptron, options.threshold, int(options.bits))
+    elif options.prune_report:
+        # Begin pruning report
+        prune_report(USE_MODEL, Perceptron)
+    elif options.quantize_report:
+        # Begin quantization report
+        quantize_report(USE_MODEL, Perceptron)
+    elif options.normalize_report:
+        # Begin normalization report
+        normalization_report(normalization or None)
+    elif options.serve:
+        # Begin serving
+        serve(USE_MODEL, False, options.bundle, SERVE_HOST, options.port, options.unix_socket,
+              options.serve_batch, options.max_wait, options.lexiconfile, options.result_cache, normalization)
+    elif options.update:
+        # Begin incremental training
+        incremental_train(USE_MODEL, Perceptron, options.average, options.stream, options.cache, metrics)
     else:
         # Begin training
-        train(USE_MODEL, options.average)
+        train(USE_MODEL, options.average, options.stream, options.cache, options.workers, options.resume, metrics,
+              options.extractors)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: metrics.py
+# @Project: ZHWordSegmentation
+
+import contextlib
+import json
+import time
+
+import numpy as np
+
+
+class Metrics(object):
+    """
+    Collect timings, counters and latencies of training and testing, and export them as JSON lines
+    """
+
+    def __init__(self, path=None, callback=None):
+        """
+        Initialize the metrics
+        :param path: append records into this file as JSON lines, if given
+        :param callback: call this function with each record, if given
+        """
+        self.path = path
+        self.callback = callback
+        self.times = dict()
+        self.counters = dict()
+        self.samples = dict()
+
+    def add_time(self, name, seconds):
+        """
+        Add time spent in a stage
+        :param name: name of stage
+        :param seconds: seconds spent
+        :return: None
+        """
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        """
+        Increase a counter
+        :param name: name of counter
+        :param value: increment
+        :return: None
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Record a sample whose percentiles are reported, e.g. a latency
+        :param name: name of samples
+        :param value: value of sample
+        :return: None
+        """
+        self.samples.setdefault(name, list()).append(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Time the body of a with statement as a stage
+        :param name: name of stage
+        :return: a context manager
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - begin)
+
+    def timed(self, iterable, name):
+        """
+        Time how long each item of an iterable takes to be produced, e.g. lazily extracted sentences
+        :param iterable: any iterable
+        :param name: name of stage
+        :return: a generator of items of *iterable*
+        """
+        iterator = iter(iterable)
+        while True:
+            begin = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - begin)
+                return
+            self.add_time(name, time.perf_counter() - begin)
+            yield item
+
+    def emit(self, event, **fields):
+        """
+        Export a record of everything collected since the last record, then reset
+        :param event: name of event, e.g. 'epoch' or 'test'
+        :param fields: extra fields of the record
+        :return: the record, a dict
+        """
+        record = {'event': event, 'time': time.time()}
+        record.update(fields)
+        for name, seconds in self.times.items():
+            record[name + '_seconds'] = round(seconds, 6)
+        record.update(self.counters)
+        for name, values in self.samples.items():
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            record[name + '_count'] = len(values)
+            record[name + '_p50'] = float(p50)
+            record[name + '_p90'] = float(p90)
+            record[name + '_p99'] = float(p99)
+
+        if self.path is not None:
+            file = open(self.path, 'a')
+            file.write(json.dumps(record) + '\n')
+            file.close()
+        if self.callback is not None:
+            self.callback(record)
+
+        self.times.clear()
+        self.counters.clear()
+        self.samples.clear()
+        return record
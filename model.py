@@ -6,8 +6,209 @@
 # @Project: ZHWordSegmentation
 
 import gzip
+import itertools
+import os
 import pickle
 
+import numpy as np
+
+# Storage types of model arguments
+WEIGHT_DTYPE = np.float32
+SUM_DTYPE = np.float64
+STEP_DTYPE = np.int64
+
+# Storage types of quantized weights by number of bits, scores of quantized weights are summed as *SCORE_DTYPE*
+QUANTIZE_DTYPES = {8: np.int8, 16: np.int16}
+SCORE_DTYPE = np.int64
+
+# Score of a label forbidden by a constraint when scores are integers, far below any reachable score
+FORBIDDEN_SCORE = -(1 << 48)
+
+
+def get_emissions(theta, sentence_features):
+    """
+    Gather the scores of every feature of a sentence in one fancy-index operation
+    :param theta: weight array of a model, row *i* holds the weights of feature *i* for label 0 and 1
+    :param sentence_features: features of input sentence, a list of tuples of feature indexes
+    :return: an (n, 2) array, column *k* is the score of label *k*
+    """
+    if len(sentence_features) == 0:
+        return np.zeros((0, 2), dtype=theta.dtype)
+    indexes = np.asarray(sentence_features, dtype=np.intp)
+    if theta.dtype.kind == 'i':
+        return theta[indexes].sum(axis=1, dtype=SCORE_DTYPE)
+    return theta[indexes].sum(axis=1)
+
+
+def constrain(emissions, constraints):
+    """
+    Force labels of characters by giving the other label a score of minus infinity,
+    or *FORBIDDEN_SCORE* if scores are integers
+    :param emissions: an (n, 2) array of scores
+    :param constraints: forced label of each character, -1 if it is not forced, or None
+    :return: *emissions*, changed in place
+    """
+    if constraints is None:
+        return emissions
+    forced = np.asarray(constraints, dtype=np.intp)
+    rows = np.flatnonzero(forced >= 0)
+    emissions[rows, 1 - forced[rows]] = -np.inf if emissions.dtype.kind == 'f' else FORBIDDEN_SCORE
+    return emissions
+
+
+def lazy_update(theta, theta_sum, last_update, step, features, labels, steps=None):
+    """
+    Reward the weights of *features* for their right labels by 1 and punish them for the other labels by 1,
+    keeping the lazily accumulated sums used by the average perceptron up to date
+    :param theta: weight array
+    :param theta_sum: accumulated weight array
+    :param last_update: step of the last update of each feature
+    :param step: current step
+    :param features: indexes of features to be updated, may contain duplicates
+    :param labels: right label of each feature in *features*
+    :param steps: step at which each update of *features* was decided, default is *step*,
+                  sums are kept as if every update had been applied at its own step
+    :return: None
+    """
+    indexes = np.asarray(features, dtype=np.intp)
+    rights = np.asarray(labels, dtype=np.intp)
+    deltas = np.ones(len(indexes), dtype=SUM_DTYPE)
+
+    # An update decided at step *t* counts for steps *t* to *step* in the sums
+    sums = deltas if steps is None else deltas * (step + 1 - np.asarray(steps, dtype=SUM_DTYPE))
+
+    # Bring sums of both labels up to date, then apply the deltas, duplicated indexes accumulate
+    theta_sum[indexes] += theta[indexes] * (step - last_update[indexes])[:, None]
+    last_update[indexes] = step
+    np.add.at(theta_sum, (indexes, rights), sums)
+    np.add.at(theta_sum, (indexes, 1 - rights), -sums)
+    np.add.at(theta, (indexes, rights), deltas.astype(theta.dtype))
+    np.add.at(theta, (indexes, 1 - rights), -deltas.astype(theta.dtype))
+
+
+def check_layout(theta, path):
+    """
+    Check that saved weights have a row of weights for label 0 and 1 per feature,
+    models saved before features were keyed independently of labels have one weight per feature
+    :param theta: saved weight array
+    :param path: save path, used in the error message
+    :return: None
+    """
+    if theta.ndim != 2 or theta.shape[1] != 2:
+        raise ValueError('Model %s has an old layout of weights with shape %s, regenerate the vocabulary and retrain '
+                         'the model' % (path, theta.shape))
+
+
+def grow_weights(theta, dimension, path):
+    """
+    Pad a saved weight array with zeros up to the dimension of a grown vocabulary,
+    features appended to the vocabulary after the model was saved have weight 0
+    :param theta: weight array
+    :param dimension: dimension of vocabulary
+    :param path: save path, used in the error message
+    :return: a weight array of *dimension* weights
+    """
+    # A vocabulary never loses features, so a model with more features was trained with another vocabulary
+    if len(theta) > dimension:
+        raise ValueError('Model %s has weights of %d features but the vocabulary has only %d, it was trained with '
+                         'another vocabulary' % (path, len(theta), dimension))
+    if len(theta) == dimension:
+        return theta
+    return np.concatenate((theta, np.zeros((dimension - len(theta),) + theta.shape[1:], dtype=theta.dtype)))
+
+
+def quantize(arrays, bits):
+    """
+    Quantize weight arrays into signed integers with a common scale, *round(weight / scale)* is stored,
+    so scores summed from different arrays stay comparable and decisions only change where scores nearly tie
+    :param arrays: a list of float weight arrays
+    :param bits: 8 or 16
+    :return: a tuple of (list of integer arrays, scale)
+    """
+    if bits not in QUANTIZE_DTYPES:
+        raise ValueError('Unsupported number of bits: %s' % bits)
+    limit = (1 << (bits - 1)) - 1
+    peak = max(float(np.abs(array).max(initial=0)) for array in arrays)
+    scale = peak / limit if peak > 0 else 1.0
+
+    # Weights of a model without averaging are integers already, they are stored exactly if they fit
+    if peak <= limit and all(np.array_equal(np.rint(array), array) for array in arrays):
+        scale = 1.0
+    quantized = [np.rint(np.asarray(array, dtype=SUM_DTYPE) / scale).astype(QUANTIZE_DTYPES[bits]) for array in arrays]
+    return quantized, scale
+
+
+def mix_states(base, states):
+    """
+    Mix training states of models trained in parallel from the same *base* state (iterative parameter mixing).
+    Weights are averaged uniformly and steps are added up as if all updates were made by a single model.
+    Accumulated sums count the mixed weights for every step of the round, so averaged weights are the average of
+    the mixed weights, not of the unmixed weights of each model
+    :param base: accumulated training state all models started from
+    :param states: training states of the models, only weights and steps are used
+    :return: the mixed training state
+    """
+    mixed = dict()
+    mixed['total_step'] = base['total_step'] + sum(state['total_step'] - base['total_step'] for state in states)
+    steps = mixed['total_step'] - base['total_step']
+    for key in base:
+        if key == 'total_step' or key.endswith('_sum'):
+            continue
+        if key.endswith('last_update'):
+            mixed[key] = np.full_like(base[key], mixed['total_step'])
+        else:
+            mixed[key] = (sum(state[key].astype(SUM_DTYPE) for state in states) / len(states)).astype(base[key].dtype)
+    for key in base:
+        if key.endswith('_sum'):
+            mixed[key] = base[key] + mixed[key[:-len('_sum')]].astype(SUM_DTYPE) * steps
+    return mixed
+
+
+def save_checkpoint(model, path, epoch, stopping=None):
+    """
+    Save the full training state of a model, the checkpoint is replaced atomically
+    :param model: a Perceptron or StructuredPerceptron
+    :param path: save path
+    :param epoch: number of finished epochs
+    :param stopping: an EarlyStopping whose state is saved along, or None
+    :return: None
+    """
+    temp_path = path + '.tmp'
+    file = gzip.open(temp_path, 'wb', compresslevel=1)
+    pickle.dump((epoch, model.get_state(), None if stopping is None else stopping.get_state()), file,
+                protocol=pickle.HIGHEST_PROTOCOL)
+    file.close()
+    os.replace(temp_path, path)
+
+    print('Checkpoint saved at path', path)
+
+
+def load_checkpoint(model, path, stopping=None):
+    """
+    Restore the full training state of a model from a checkpoint, weights are padded up to the dimension of *model*
+    :param model: a Perceptron or StructuredPerceptron
+    :param path: save path
+    :param stopping: an EarlyStopping to be restored too, or None
+    :return: number of finished epochs
+    """
+    file = gzip.open(path, 'rb')
+    checkpoint = pickle.load(file)
+    file.close()
+    epoch, state = checkpoint[:2]
+    check_layout(state['theta'], path)
+
+    # The vocabulary may have grown since the checkpoint was saved, new features start from 0
+    for key in ('theta', 'theta_sum', 'last_update'):
+        state[key] = grow_weights(state[key], model.dimension, path)
+    model.set_state(state)
+
+    # Checkpoints without the state of early stopping start it over
+    if stopping is not None and len(checkpoint) > 2 and checkpoint[2] is not None:
+        stopping.set_state(checkpoint[2])
+
+    print('Checkpoint loaded from path', path)
+    return epoch
+
 
 class Perceptron(object):
     """
@@ -20,57 +221,160 @@ class Perceptron(object):
         :param dimension: dimension of vocabulary
         """
         self.dimension = dimension
-        self.theta = [0] * dimension
-        self.theta_sum = [0] * dimension
-        self.last_update = [0] * dimension
+        self.theta = np.zeros((dimension, 2), dtype=WEIGHT_DTYPE)
+        self.theta_sum = np.zeros((dimension, 2), dtype=SUM_DTYPE)
+        self.last_update = np.zeros(dimension, dtype=STEP_DTYPE)
         self.total_step = 0
 
     def get_score(self, features):
         """
-        Get scores of input features
+        Get scores of input features for both labels with a single lookup
         :param features: features of a character, should be a tuple contains indexes of features in vocabulary
-        :return: score of *features*
+        :return: a list of [score of label 0, score of label 1]
+        """
+        return self.theta[np.asarray(features, dtype=np.intp)].sum(axis=0).tolist()
+
+    def get_emissions(self, sentence_features):
+        """
+        Get scores of all characters of a sentence with a single gather
+        :param sentence_features: features of input sentence
+        :return: an (n, 2) array, column *k* is the score of label *k*
         """
-        return sum([self.theta[i] for i in features])
+        return get_emissions(self.theta, sentence_features)
 
     def update(self, feature_list, label):
         """
         Update arguments of model
-        :param feature_list: features of a character, should be a tuple like (features_0_labeled, features_1_labeled)
+        :param feature_list: features of a character, should be a tuple contains indexes of features in vocabulary
         :param label: correct label of this character
-        :return: None
+        :return: True if arguments are updated
         """
         # Compute scores
-        score_true = self.get_score(feature_list[label])
-        score_false = self.get_score(feature_list[1 - label])
+        scores = self.get_score(feature_list)
 
         # Update theta
         self.total_step += 1
-        if score_false >= score_true:
-            for i in feature_list[label]:
-                self.theta_sum[i] += self.theta[i] * (self.total_step - self.last_update[i]) + 1
-                self.theta[i] += 1
-                self.last_update[i] = self.total_step
-            for i in feature_list[1 - label]:
-                self.theta_sum[i] += self.theta[i] * (self.total_step - self.last_update[i]) - 1
-                self.theta[i] -= 1
-                self.last_update[i] = self.total_step
+        if scores[1 - label] >= scores[label]:
+            lazy_update(self.theta, self.theta_sum, self.last_update, self.total_step,
+                        feature_list, [label] * len(feature_list))
+            return True
+        return False
+
+    def update_sentence(self, sentence_features, sentence_labels):
+        """
+        Update arguments of model with each character of a sentence in turn, the same as calling *update*
+        on every character. Scores of the sentence are gathered at once and corrected in plain Python by the updates
+        made earlier in the sentence, then all updates are applied together
+        :param sentence_features: features of input sentence
+        :param sentence_labels: correct labels of input sentence
+        :return: number of updates
+        """
+        if len(sentence_features) == 0:
+            return 0
+        emissions = self.get_emissions(sentence_features).tolist()
+        rows = np.asarray(sentence_features, dtype=np.intp).tolist()
+        labels = np.asarray(sentence_labels, dtype=np.intp).tolist()
+
+        # Change of score of label 1 minus score of label 0 of each feature updated in this sentence
+        changes = dict()
+        updates = 0
+        features = list()
+        rights = list()
+        steps = list()
+        for emission, feature_list, label in zip(emissions, rows, labels):
+            self.total_step += 1
+            margin = emission[1] - emission[0]
+            if changes:
+                margin += sum(changes.get(i, 0) for i in feature_list)
+            if margin <= 0 if label == 1 else margin >= 0:
+                updates += 1
+                change = 2 if label == 1 else -2
+                for i in feature_list:
+                    changes[i] = changes.get(i, 0) + change
+                features.extend(feature_list)
+                rights.extend([label] * len(feature_list))
+                steps.extend([self.total_step] * len(feature_list))
+
+        if features:
+            lazy_update(self.theta, self.theta_sum, self.last_update, self.total_step, features, rights, steps)
+        return updates
 
     def predict(self, feature_list):
         """
         Get prediction of input features
-        :param feature_list: features of a character, should be a tuple like (features_0_labeled, features_1_labeled)
+        :param feature_list: features of a character, should be a tuple contains indexes of features in vocabulary
         :return: prediction of *feature_list*
         """
         # Compute scores
-        score0 = self.get_score(feature_list[0])
-        score1 = self.get_score(feature_list[1])
+        score0, score1 = self.get_score(feature_list)
 
         if score0 > score1:
             return 0
         else:
             return 1
 
+    def predict_sentence(self, sentence_features, constraints=None):
+        """
+        Get predictions of all characters of a sentence
+        :param sentence_features: features of input sentence
+        :param constraints: forced label of each character, -1 if it is not forced
+        :return: a list of 0/1 predictions
+        """
+        emissions = constrain(self.get_emissions(sentence_features), constraints)
+        return (emissions[:, 1] >= emissions[:, 0]).astype(int).tolist()
+
+    def accumulate(self):
+        """
+        Bring the lazily accumulated weights up to the current step
+        :return: None
+        """
+        self.theta_sum += self.theta * (self.total_step - self.last_update)[:, None]
+        self.last_update[:] = self.total_step
+
+    def get_state(self):
+        """
+        Get the full training state of the model
+        :return: a dict of arguments
+        """
+        return {
+            'theta': self.theta,
+            'theta_sum': self.theta_sum,
+            'last_update': self.last_update,
+            'total_step': self.total_step
+        }
+
+    def set_state(self, state):
+        """
+        Restore the full training state of the model
+        :param state: a dict of arguments returned by *get_state*
+        :return: None
+        """
+        self.theta = state['theta']
+        self.theta_sum = state['theta_sum']
+        self.last_update = state['last_update']
+        self.total_step = state['total_step']
+        self.dimension = len(self.theta)
+
+    def get_average(self):
+        """
+        Get averaged weights without changing the training state
+        :return: averaged theta
+        """
+        step = max(self.total_step, 1)
+        theta = (self.theta_sum + self.theta * (self.total_step - self.last_update)[:, None]) / step
+        return theta.astype(WEIGHT_DTYPE)
+
+    def quantize(self, bits):
+        """
+        Get a copy of the model for prediction only, whose weights are quantized integers
+        :param bits: 8 or 16
+        :return: a Perceptron whose theta is an integer array, weights are *theta* times *scale*
+        """
+        model = Perceptron(0)
+        (model.theta,), model.scale = quantize([self.theta], bits)
+        model.dimension = len(model.theta)
+        return model
+
     def save(self, path, average=True):
         """
         Save the model arguments
@@ -78,15 +382,11 @@ class Perceptron(object):
         :param average: use average perceptron
         :return: None
         """
-        if average:
-            # Make average
-            for i in range(self.dimension):
-                if self.last_update[i] != self.total_step:
-                    self.theta_sum[i] += self.theta[i] * (self.total_step - self.last_update[i])
-                self.theta[i] = self.theta_sum[i] / self.total_step
+        # Averaged weights are computed aside, so the training state is kept and training can continue
+        theta = self.get_average() if average else self.theta
 
-        file = gzip.open(path, 'wb')
-        pickle.dump(self.theta, file)
+        file = gzip.open(path, 'wb', compresslevel=1)
+        pickle.dump(theta, file)
         file.close()
 
         print('Model saved at path', path)
@@ -98,8 +398,10 @@ class Perceptron(object):
         :return: None
         """
         file = gzip.open(path, 'rb')
-        self.theta = pickle.load(file)
+        theta = np.asarray(pickle.load(file), dtype=WEIGHT_DTYPE)
         file.close()
+        check_layout(theta, path)
+        self.theta = grow_weights(theta, self.dimension, path)
 
         print('Model loaded from saved model', path)
 
@@ -115,34 +417,45 @@ class StructuredPerceptron(object):
         :param dimension: dimension of vocabulary
         """
         self.dimension = dimension
-        self.theta = [0] * dimension
-        self.theta_sum = [0] * dimension
+        self.theta = np.zeros((dimension, 2), dtype=WEIGHT_DTYPE)
+        self.theta_sum = np.zeros((dimension, 2), dtype=SUM_DTYPE)
 
-        self.transitions = [[0, 0], [0, 0]]
-        self.transitions_sum = [[0, 0], [0, 0]]
+        self.transitions = np.zeros((2, 2), dtype=WEIGHT_DTYPE)
+        self.transitions_sum = np.zeros((2, 2), dtype=SUM_DTYPE)
 
-        self.last_update = [0] * dimension
-        self.transitions_last_update = [[0, 0], [0, 0]]
+        self.last_update = np.zeros(dimension, dtype=STEP_DTYPE)
+        self.transitions_last_update = np.zeros((2, 2), dtype=STEP_DTYPE)
         self.total_step = 0
 
     def get_score(self, features):
         """
-        Get scores of input features
+        Get scores of input features for both labels with a single lookup
         :param features: features of a character, should be a tuple contains indexes of features in vocabulary
-        :return: score of *features*
+        :return: a list of [score of label 0, score of label 1]
+        """
+        return self.theta[np.asarray(features, dtype=np.intp)].sum(axis=0).tolist()
+
+    def get_emissions(self, sentence_features):
+        """
+        Get scores of all characters of a sentence with a single gather
+        :param sentence_features: features of input sentence
+        :return: an (n, 2) array, column *k* is the score of label *k*
         """
-        return sum([self.theta[i] for i in features])
+        return get_emissions(self.theta, sentence_features)
 
-    def predict(self, sentence_features):
+    def predict(self, sentence_features, constraints=None):
         """
         Get prediction of input sentence features, using Viterbi Algorithm
         :param sentence_features: features of input sentence
+        :param constraints: forced label of each character, -1 if it is not forced, paths against them are never taken
         :return: a list of 0/1 predictions
         """
+        if len(sentence_features) == 0:
+            return []
+
         # Get emissions
-        emissions = list()
-        for feature_list in sentence_features:
-            emissions.append([self.get_score(feature_list[0]), self.get_score(feature_list[1])])
+        emissions = constrain(self.get_emissions(sentence_features), constraints).tolist()
+        transitions = self.transitions.tolist()
 
         # Viterbi forward
         alphas = list()
@@ -150,11 +463,11 @@ class StructuredPerceptron(object):
         alphas.append([emissions[0][0], emissions[0][1]])
         pointers.append([-1, -1])
         for i in range(1, len(sentence_features)):
-            score00 = alphas[i - 1][0] + self.transitions[0][0] + emissions[i][0]
-            score10 = alphas[i - 1][1] + self.transitions[1][0] + emissions[i][0]
+            score00 = alphas[i - 1][0] + transitions[0][0] + emissions[i][0]
+            score10 = alphas[i - 1][1] + transitions[1][0] + emissions[i][0]
 
-            score01 = alphas[i - 1][0] + self.transitions[0][1] + emissions[i][1]
-            score11 = alphas[i - 1][1] + self.transitions[1][1] + emissions[i][1]
+            score01 = alphas[i - 1][0] + transitions[0][1] + emissions[i][1]
+            score11 = alphas[i - 1][1] + transitions[1][1] + emissions[i][1]
 
             alphas.append([max([score00, score10]), max([score01, score11])])
             pointers.append([0 if score00 > score10 else 1, 0 if score01 > score11 else 1])
@@ -167,53 +480,233 @@ class StructuredPerceptron(object):
 
         return tags
 
+    def predict_stream(self, feature_chunks, chunk_constraints=None):
+        """
+        Get prediction of a long sentence given chunk by chunk, using Viterbi Algorithm with bounded memory.
+        Tags are decided as soon as the best paths ending with both tags share a prefix, so the result is exactly
+        the same as *predict* while only the undecided suffix of back pointers is kept
+        :param feature_chunks: an iterable of lists of features, consecutive parts of the sentence
+        :param chunk_constraints: an iterable of forced labels of each chunk, or None
+        :return: a generator of lists of 0/1 predictions, concatenated they are the prediction of the sentence
+        """
+        transitions = self.transitions.tolist()
+        alphas = None
+        pointers = list()  # back pointers of undecided positions
+
+        if chunk_constraints is None:
+            chunk_constraints = itertools.repeat(None)
+        for sentence_features, constraints in zip(feature_chunks, chunk_constraints):
+            if len(sentence_features) == 0:
+                continue
+
+            # Viterbi forward
+            for emission in constrain(self.get_emissions(sentence_features), constraints).tolist():
+                if alphas is None:
+                    alphas = emission
+                    pointers.append([-1, -1])
+                    continue
+                score00 = alphas[0] + transitions[0][0] + emission[0]
+                score10 = alphas[1] + transitions[1][0] + emission[0]
+
+                score01 = alphas[0] + transitions[0][1] + emission[1]
+                score11 = alphas[1] + transitions[1][1] + emission[1]
+
+                alphas = [max([score00, score10]), max([score01, score11])]
+                pointers.append([0 if score00 > score10 else 1, 0 if score01 > score11 else 1])
+
+            # Trace back from both tags until the paths merge, everything before is decided
+            tag0, tag1 = 0, 1
+            i = len(pointers) - 1
+            while i > 0 and tag0 != tag1:
+                tag0, tag1 = pointers[i][tag0], pointers[i][tag1]
+                i -= 1
+            if tag0 == tag1 and i > 0:
+                tags = [tag0]
+                for j in range(i, 0, -1):
+                    tags.append(pointers[j][tags[-1]])
+                tags.reverse()
+                pointers = pointers[i + 1:]
+                yield tags
+
+        if alphas is None:
+            return
+
+        # Viterbi backward of the undecided suffix
+        tags = [0 if alphas[0] > alphas[1] else 1]
+        for i in range(len(pointers) - 1, 0, -1):
+            tags.append(pointers[i][tags[-1]])
+        tags.reverse()
+        yield tags
+
+    def predict_batch(self, batch_sentence_features, batch_size=512, batch_constraints=None):
+        """
+        Get predictions of many sentences, sentences are bucketed by length, padded and decoded together
+        :param batch_sentence_features: a list of features of input sentences
+        :param batch_size: max number of sentences decoded together
+        :param batch_constraints: a list of forced labels of each sentence, or None
+        :return: a list of lists of 0/1 predictions, in the same order as *batch_sentence_features*
+        """
+        results = [[] for _ in range(len(batch_sentence_features))]
+        order = sorted(range(len(batch_sentence_features)), key=lambda k: len(batch_sentence_features[k]))
+        order = [k for k in order if len(batch_sentence_features[k]) > 0]
+
+        for begin in range(0, len(order), batch_size):
+            bucket = order[begin:begin + batch_size]
+            constraints = None if batch_constraints is None else [batch_constraints[k] for k in bucket]
+            for k, tags in zip(bucket, self._viterbi_batch([batch_sentence_features[k] for k in bucket], constraints)):
+                results[k] = tags
+        return results
+
+    def _viterbi_batch(self, bucket, constraints=None):
+        """
+        Run Viterbi Algorithm over a bucket of non-empty sentences as array operations
+        :param bucket: a list of features of input sentences
+        :param constraints: a list of forced labels of each sentence, or None
+        :return: a list of lists of 0/1 predictions
+        """
+        lengths = np.array([len(sentence_features) for sentence_features in bucket])
+        batch, max_length = len(bucket), int(lengths.max())
+
+        # Gather emissions of the whole bucket at once, then scatter them into a padded array
+        flat = get_emissions(self.theta, np.concatenate([np.asarray(sentence_features, dtype=np.intp)
+                                                         for sentence_features in bucket]))
+        if constraints is not None:
+            flat = constrain(flat, [label for sentence_constraints in constraints for label in sentence_constraints])
+        rows = np.repeat(np.arange(batch), lengths)
+        cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        dtype = np.float64 if flat.dtype.kind == 'f' else SCORE_DTYPE
+        emissions = np.zeros((batch, max_length, 2), dtype=dtype)
+        emissions[rows, cols] = flat
+        mask = np.arange(max_length)[None, :] < lengths[:, None]
+        transitions = self.transitions.astype(dtype)
+
+        # Viterbi forward, padded positions keep their alphas and point to themselves
+        alphas = emissions[:, 0, :]
+        pointers = np.zeros((batch, max_length, 2), dtype=np.int8)
+        identity = np.array([0, 1], dtype=np.int8)
+        for i in range(1, max_length):
+            scores = alphas[:, :, None] + transitions[None, :, :] + emissions[:, i, None, :]
+            best = (scores[:, 1, :] >= scores[:, 0, :]).astype(np.int8)
+            valid = mask[:, i, None]
+            alphas = np.where(valid, np.maximum(scores[:, 0, :], scores[:, 1, :]), alphas)
+            pointers[:, i, :] = np.where(valid, best, identity)
+
+        # Viterbi backward
+        tags = np.zeros((batch, max_length), dtype=np.int8)
+        tags[:, -1] = alphas[:, 1] >= alphas[:, 0]
+        for i in range(max_length - 1, 0, -1):
+            tags[:, i - 1] = pointers[np.arange(batch), i, tags[:, i]]
+
+        return [tags[k, :lengths[k]].tolist() for k in range(batch)]
+
     def update(self, sentence_features, sentence_labels):
         """
         Update arguments of model
         :param sentence_features: features of input sentence
         :param sentence_labels: labels of input sentence
-        :return: None
+        :return: number of wrongly predicted characters, arguments are updated if it is not 0
         """
         pred = self.predict(sentence_features)
 
         self.total_step += 1
-        if pred == sentence_labels:
-            return
-
         if len(pred) != len(sentence_labels):
             print('Vector dimension not compatible')
 
+        # Labels may be a list or an array, only wrongly predicted characters are visited
+        positions = np.flatnonzero(np.asarray(pred) != np.asarray(sentence_labels))
+        mistakes = len(positions)
+        if mistakes == 0:
+            return 0
+
+        # Collect features of wrong characters and their right labels, they are updated together below
+        rights = np.asarray(sentence_labels, dtype=np.intp)[positions]
+        wrong_features = np.asarray(sentence_features, dtype=np.intp)[positions]
+        features = wrong_features.ravel()
+        labels = np.repeat(rights, wrong_features.shape[1])
+
         # Update arguments
-        for i in range(len(sentence_labels)):
-            if pred[i] != sentence_labels[i]:
-                right = sentence_labels[i]
-                wrong = pred[i]
-
-                # Update arguments of right features
-                for feature in sentence_features[i][right]:
-                    self.theta_sum[feature] += self.theta[feature] * (self.total_step - self.last_update[feature]) + 1
-                    self.theta[feature] += 1
-                    self.last_update[feature] = self.total_step
-
-                # Update arguments of right transitions
-                prev = pred[i - 1] if i > 0 else 1
-                self.transitions_sum[prev][right] += self.transitions[prev][right] * (
-                        self.total_step - self.transitions_last_update[prev][right]) + 1
-                self.transitions[prev][right] += 1
-                self.transitions_last_update[prev][right] = self.total_step
-
-                # Update arguments of wrong features
-                for feature in sentence_features[i][wrong]:
-                    self.theta_sum[feature] += self.theta[feature] * (self.total_step - self.last_update[feature]) - 1
-                    self.theta[feature] -= 1
-                    self.last_update[feature] = self.total_step
-
-                # Update arguments of wrong transitions
-                prev = pred[i - 1] if i > 0 else 1
-                self.transitions_sum[prev][wrong] += self.transitions[prev][wrong] * (
-                        self.total_step - self.transitions_last_update[prev][wrong]) - 1
-                self.transitions[prev][wrong] -= 1
-                self.transitions_last_update[prev][wrong] = self.total_step
+        for i, right in zip(positions.tolist(), rights.tolist()):
+            wrong = pred[i]
+
+            # Update arguments of right transitions
+            prev = pred[i - 1] if i > 0 else 1
+            self.transitions_sum[prev][right] += self.transitions[prev][right] * (
+                    self.total_step - self.transitions_last_update[prev][right]) + 1
+            self.transitions[prev][right] += 1
+            self.transitions_last_update[prev][right] = self.total_step
+
+            # Update arguments of wrong transitions
+            prev = pred[i - 1] if i > 0 else 1
+            self.transitions_sum[prev][wrong] += self.transitions[prev][wrong] * (
+                    self.total_step - self.transitions_last_update[prev][wrong]) - 1
+            self.transitions[prev][wrong] -= 1
+            self.transitions_last_update[prev][wrong] = self.total_step
+
+        # Update arguments of right and wrong features
+        lazy_update(self.theta, self.theta_sum, self.last_update, self.total_step, features, labels)
+        return mistakes
+
+    def accumulate(self):
+        """
+        Bring the lazily accumulated weights and transitions up to the current step
+        :return: None
+        """
+        self.theta_sum += self.theta * (self.total_step - self.last_update)[:, None]
+        self.last_update[:] = self.total_step
+        self.transitions_sum += self.transitions * (self.total_step - self.transitions_last_update)
+        self.transitions_last_update[:] = self.total_step
+
+    def get_state(self):
+        """
+        Get the full training state of the model
+        :return: a dict of arguments
+        """
+        return {
+            'theta': self.theta,
+            'theta_sum': self.theta_sum,
+            'last_update': self.last_update,
+            'transitions': self.transitions,
+            'transitions_sum': self.transitions_sum,
+            'transitions_last_update': self.transitions_last_update,
+            'total_step': self.total_step
+        }
+
+    def set_state(self, state):
+        """
+        Restore the full training state of the model
+        :param state: a dict of arguments returned by *get_state*
+        :return: None
+        """
+        self.theta = state['theta']
+        self.theta_sum = state['theta_sum']
+        self.last_update = state['last_update']
+        self.transitions = state['transitions']
+        self.transitions_sum = state['transitions_sum']
+        self.transitions_last_update = state['transitions_last_update']
+        self.total_step = state['total_step']
+        self.dimension = len(self.theta)
+
+    def get_average(self):
+        """
+        Get averaged weights and transitions without changing the training state
+        :return: a tuple of (averaged theta, averaged transitions)
+        """
+        step = max(self.total_step, 1)
+        theta = (self.theta_sum + self.theta * (self.total_step - self.last_update)[:, None]) / step
+        transitions = self.transitions_sum + self.transitions * (self.total_step - self.transitions_last_update)
+        transitions = transitions / step
+        return theta.astype(WEIGHT_DTYPE), transitions.astype(WEIGHT_DTYPE)
+
+    def quantize(self, bits):
+        """
+        Get a copy of the model for prediction only, whose weights and transitions are quantized integers
+        :param bits: 8 or 16
+        :return: a StructuredPerceptron whose theta and transitions are integer arrays sharing one *scale*
+        """
+        model = StructuredPerceptron(0)
+        (model.theta, model.transitions), model.scale = quantize([self.theta, self.transitions], bits)
+        model.dimension = len(model.theta)
+        return model
 
     def save(self, path, average=True):
         """
@@ -222,20 +715,11 @@ class StructuredPerceptron(object):
         :param average: use average perceptron
         :return: None
         """
-        if average:
-            # Make average
-            for i in range(self.dimension):
-                if self.last_update[i] != self.total_step:
-                    self.theta_sum[i] += self.theta[i] * (self.total_step - self.last_update[i])
-                self.theta[i] = self.theta_sum[i] / self.total_step
-            for i in range(2):
-                for j in range(2):
-                    self.transitions_sum[i][j] += self.transitions[i][j] * (
-                            self.total_step - self.transitions_last_update[i][j])
-                self.transitions[i][j] = self.transitions_sum[i][j] / self.total_step
-
-        file = gzip.open(path, 'wb')
-        pickle.dump((self.theta, self.transitions), file)
+        # Averaged weights are computed aside, so the training state is kept and training can continue
+        theta, transitions = self.get_average() if average else (self.theta, self.transitions)
+
+        file = gzip.open(path, 'wb', compresslevel=1)
+        pickle.dump((theta, transitions), file)
         file.close()
 
         print('Model saved at path', path)
@@ -247,7 +731,11 @@ class StructuredPerceptron(object):
         :return: None
         """
         file = gzip.open(path, 'rb')
-        self.theta, self.transitions = pickle.load(file)
+        theta, transitions = pickle.load(file)
         file.close()
+        theta = np.asarray(theta, dtype=WEIGHT_DTYPE)
+        check_layout(theta, path)
+        self.theta = grow_weights(theta, self.dimension, path)
+        self.transitions = np.asarray(transitions, dtype=WEIGHT_DTYPE)
 
         print('Model loaded from saved model', path)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: normalize.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+
+import unicodedata
+
+# Names of normalization steps
+NORMALIZATION_STEPS = ('nfkc', 'digit', 'latin', 'punctuation')
+
+# Class symbols replacing characters of a class
+DIGIT_SYMBOL = '0'
+LATIN_SYMBOL = 'a'
+PUNCTUATION_SYMBOL = '.'
+
+
+class CharTable(dict):
+    """
+    A translation table for str.translate, mapping of a character is computed when it is first seen
+    """
+
+    def __init__(self, steps):
+        """
+        Initialize the table
+        :param steps: names of normalization steps, applied in order
+        """
+        super(CharTable, self).__init__()
+        self.steps = steps
+
+    def __missing__(self, code):
+        char = normalize_char(chr(code), self.steps)
+        self[code] = char
+        return char
+
+
+def normalize_char(char, steps):
+    """
+    Normalize a character, the result is always a single character so that labels stay aligned
+    :param char: input character
+    :param steps: names of normalization steps, applied in order:
+                  'nfkc' folds compatibility forms like full-width letters and digits,
+                  'digit' collapses digits, 'latin' collapses Latin letters, 'punctuation' collapses punctuation
+    :return: normalized character
+    """
+    for step in steps:
+        if step == 'nfkc':
+            folded = unicodedata.normalize('NFKC', char)
+            if len(folded) == 1:
+                char = folded
+        elif step == 'digit':
+            if char.isdigit():
+                char = DIGIT_SYMBOL
+        elif step == 'latin':
+            if 'a' <= char <= 'z' or 'A' <= char <= 'Z':
+                char = LATIN_SYMBOL
+        elif step == 'punctuation':
+            if unicodedata.category(char).startswith('P'):
+                char = PUNCTUATION_SYMBOL
+    return char
+
+
+def compile_normalizer(steps=NORMALIZATION):
+    """
+    Compile normalization steps into a function normalizing a text character by character
+    :param steps: names of normalization steps, see *normalize_char*
+    :return: a function normalize(text) returning a text of the same length, or None if there is no step
+    """
+    if not steps:
+        return None
+    for step in steps:
+        if step not in NORMALIZATION_STEPS:
+            raise ValueError('Unknown normalization step: %s' % step)
+    table = CharTable(list(steps))
+
+    def normalize(text):
+        return text.translate(table)
+
+    return normalize
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: output.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from evaluate import get_offsets
+
+import gzip
+import itertools
+import json
+import sys
+
+
+def open_text(path, mode='r'):
+    """
+    Open a text file for reading or writing, '-' means stdin or stdout and a '.gz' suffix means gzip
+    :param path: path of file
+    :param mode: 'r' or 'w'
+    :return: a file object, stdin and stdout are not closed when it is closed
+    """
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.__stdout__
+        return open(stream.fileno(), mode, encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+
+
+def format_line(sentence, pred, output_format='plain'):
+    """
+    Format a segmented sentence as a line of output
+    :param sentence: input sentence
+    :param pred: 0/1 predictions of each character
+    :param output_format: 'plain' for words followed by two spaces, 'offsets' for 'begin,end' of words,
+                          'jsonl' for a JSON object of text, words and offsets
+    :return: a line ending with a newline
+    """
+    if output_format == 'plain':
+        # A word is followed by two spaces only if a boundary is predicted after it
+        ends = list(itertools.compress(range(1, len(pred) + 1), pred))
+        begins = [0] + ends
+        return ''.join([sentence[begin:end] + '  ' for begin, end in zip(begins, ends)]) + \
+            sentence[begins[-1]:len(pred)] + '\n'
+
+    spans = get_offsets(pred)
+    if output_format == 'offsets':
+        return ' '.join('%d,%d' % span for span in spans) + '\n'
+    if output_format == 'jsonl':
+        return json.dumps({
+            'text': sentence,
+            'words': [sentence[begin:end] for begin, end in spans],
+            'offsets': spans
+        }, ensure_ascii=False) + '\n'
+    raise ValueError('Unknown output format: %s' % output_format)
+
+
+class OutputWriter(object):
+    """
+    A writer of segmentation results, lines are assembled in memory and written in large blocks
+    """
+
+    def __init__(self, path, output_format='plain', buffer_size=OUTPUT_BUFFER_SIZE):
+        """
+        Open the output
+        :param path: output path, '-' means stdout and a '.gz' suffix means gzip
+        :param output_format: one of *OUTPUT_FORMATS*, see *format_line*
+        :param buffer_size: number of characters collected before a block is written
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError('Unknown output format: %s' % output_format)
+        self.path = path
+        self.output_format = output_format
+        self.buffer_size = buffer_size
+        self.file = open_text(path, 'w')
+        self.lines = list()
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, sentence, pred):
+        """
+        Write a segmented sentence
+        :param sentence: input sentence
+        :param pred: 0/1 predictions of each character
+        :return: None
+        """
+        self.write_lines([format_line(sentence, pred, self.output_format)])
+
+    def write_lines(self, lines):
+        """
+        Write lines already formatted by *format_line*
+        :param lines: a list of lines
+        :return: None
+        """
+        self.lines.extend(lines)
+        self.buffered += sum(len(line) for line in lines)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write collected lines as a single block
+        :return: None
+        """
+        self.file.write(''.join(self.lines))
+        self.lines = list()
+        self.buffered = 0
+
+    def close(self):
+        """
+        Flush collected lines and close the output
+        :return: None
+        """
+        self.flush()
+        self.file.close()
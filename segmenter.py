@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: segmenter.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from model import Perceptron, StructuredPerceptron
+from dataset import batched, split_safe
+from evaluate import get_offsets
+from cache import ResultCache
+from lexicon import load_lexicon
+from output import format_line
+from train_test import (load_dataset_and_model, predict_all, predict_chunks, predict_sentences, get_constraints,
+                        cached_predict)
+
+import contextlib
+import sys
+
+
+class Segmenter(object):
+    """
+    An in-process segmenter, vocabulary and model are loaded once and reused by every call
+    """
+
+    def __init__(self, model_name=STRUCTURED_PERCEPTRON_MODEL, structured=True, bundle=False, batch_size=BATCH_SIZE,
+                 lexicon_path=None, cache_size=0, normalization=NORMALIZATION, verbose=False):
+        """
+        Load vocabulary and a saved model
+        :param model_name: model to be used
+        :param structured: the model is a structured perceptron
+        :param bundle: load vocabulary and model from the model bundle
+        :param batch_size: max number of sentences decoded together
+        :param lexicon_path: path of user lexicon, words of it are never split
+        :param cache_size: if positive, results of at most *cache_size* recent sentences are cached
+        :param normalization: normalization steps applied before feature extraction, they must be the steps
+                              the vocabulary or the bundle was built with, see normalize.py
+        :param verbose: print loading messages to stdout, otherwise they are written to stderr
+                        so that stdout of the calling program is left alone
+        """
+        model_class = StructuredPerceptron if structured else Perceptron
+        with contextlib.redirect_stdout(sys.stdout if verbose else sys.stderr):
+            self.dataset, self.model = load_dataset_and_model('keyboard', model_class, model_name, bundle,
+                                                              normalization=normalization)
+            self.lexicon = load_lexicon(lexicon_path) if lexicon_path else None
+        self.batch_size = batch_size
+        self.result_cache = ResultCache(cache_size) if cache_size > 0 else None
+
+    def segment(self, text, offsets=False):
+        """
+        Segment a sentence
+        :param text: input sentence
+        :param offsets: return (begin, end) offsets of words in *text* instead of words
+        :return: a list of words or offsets
+        """
+        return self.segment_batch([text], offsets)[0]
+
+    def segment_batch(self, texts, offsets=False):
+        """
+        Segment a list of sentences, structured models decode them together
+        :param texts: a list of input sentences
+        :param offsets: return (begin, end) offsets of words in each text instead of words
+        :return: a list of lists of words or offsets
+        """
+        results = list()
+        for text, pred in zip(texts, self.predict_batch(texts)):
+            spans = get_offsets(pred)
+            results.append(spans if offsets else [text[begin:end] for begin, end in spans])
+        return results
+
+    def format_batch(self, texts, output_format='plain'):
+        """
+        Segment a list of sentences into lines formatted as test results
+        :param texts: a list of input sentences
+        :param output_format: one of *OUTPUT_FORMATS*, see *format_line*
+        :return: a list of lines ending with a newline
+        """
+        return [format_line(text, pred, output_format) for text, pred in zip(texts, self.predict_batch(texts))]
+
+    def predict_batch(self, texts):
+        """
+        Get predictions of a list of sentences, from the result cache if there is one
+        :param texts: a list of input sentences
+        :return: a list of lists of 0/1 predictions
+        """
+        if self.result_cache is not None:
+            return cached_predict(self.model, self.dataset, texts, self.result_cache, self.lexicon)
+        return predict_sentences(self.model, self.dataset, texts, self.lexicon)
+
+    def segment_stream(self, texts, offsets=False):
+        """
+        Segment sentences of an iterable lazily, *batch_size* sentences at a time
+        :param texts: an iterable of input sentences
+        :param offsets: yield (begin, end) offsets of words in each text instead of words
+        :return: a generator of lists of words or offsets, in the same order as *texts*
+        """
+        for batch in batched(texts, self.batch_size):
+            for result in self.segment_batch(batch, offsets):
+                yield result
+
+    def segment_long(self, text, offsets=False, chunk_size=CHUNK_SIZE):
+        """
+        Segment a long text with bounded memory, words are yielded as soon as their boundaries are decided.
+        Structured models give exactly the same result as *segment*, words of the lexicon are never split either
+        :param text: input text
+        :param offsets: yield (begin, end) offsets of words in *text* instead of words
+        :param chunk_size: number of characters whose features are generated at a time
+        :return: a generator of words or offsets
+        """
+        begin = 0
+        position = 0
+        for pred in predict_chunks(self.model, self.dataset, text, self.lexicon, chunk_size):
+            for tag in pred:
+                position += 1
+                if tag == 1:
+                    yield (begin, position) if offsets else text[begin:position]
+                    begin = position
+        if begin < len(text):
+            yield (begin, len(text)) if offsets else text[begin:]
+
+    def segment_document(self, text, offsets=False, max_length=CHUNK_SIZE):
+        """
+        Segment a long text by splitting it after sentence-final punctuation, pieces are decoded together.
+        Features near a split still see the neighbouring characters, the boundary after the punctuation is forced
+        while decoding, so the path before it is decoded knowing it
+        :param text: input text
+        :param offsets: return (begin, end) offsets of words in *text* instead of words
+        :param max_length: preferred max length of pieces
+        :return: a list of words or offsets
+        """
+        pieces = split_safe(text, max_length)
+        features = [self.dataset.generate_features(text, begin, end) for begin, end in pieces]
+        constraints = get_constraints(self.lexicon, [text[begin:end] for begin, end in pieces])
+        if constraints is None:
+            constraints = [[-1] * (end - begin) for begin, end in pieces]
+        for forced in constraints:
+            forced[-1] = 1
+
+        results = list()
+        for (begin, end), pred in zip(pieces, predict_all(self.model, features, constraints)):
+            for word_begin, word_end in get_offsets(pred):
+                word = (begin + word_begin, begin + word_end)
+                results.append(word if offsets else text[word[0]:word[1]])
+        return results
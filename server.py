@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: server.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from segmenter import Segmenter
+
+import asyncio
+import concurrent.futures
+import sys
+import time
+
+
+class MicroBatcher(object):
+    """
+    Collect concurrent segmentation requests into micro-batches
+    """
+
+    def __init__(self, segment, batch_size=SERVE_BATCH_SIZE, max_wait=SERVE_MAX_WAIT):
+        """
+        Initialize the batcher
+        :param segment: a function segmenting a list of texts into a list of results
+        :param batch_size: max number of texts segmented together
+        :param max_wait: max seconds the first text of a batch waits for more texts
+        """
+        self.segment = segment
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+
+        # A single thread runs the model, so the event loop keeps accepting requests meanwhile
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    async def submit(self, text):
+        """
+        Segment a text as part of the next batch
+        :param text: input sentence
+        :return: result of *text*
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def run(self):
+        """
+        Take texts from the queue and segment them batch by batch, forever
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, future in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.segment, texts)
+            except Exception as e:
+                for text, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (text, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class SegmentationServer(object):
+    """
+    A local HTTP service segmenting texts with a model loaded once.
+    POST /segment with one sentence per line in the body, segmented sentences are returned in the same format as
+    plain test results; GET /health returns ok; GET /stats returns hits, misses and hit rate of the result cache.
+    Malformed requests are answered with 400 Bad Request, failures of segmentation with 500 Internal Server Error
+    """
+
+    def __init__(self, segmenter, batch_size=SERVE_BATCH_SIZE, max_wait=SERVE_MAX_WAIT):
+        """
+        Initialize the server
+        :param segmenter: a loaded Segmenter
+        :param batch_size: max number of sentences segmented together
+        :param max_wait: max seconds a sentence waits for a batch to be filled
+        """
+        self.segmenter = segmenter
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batcher = None
+
+    async def handle(self, reader, writer):
+        """
+        Serve HTTP requests of a connection
+        :param reader: stream reader of the connection
+        :param writer: stream writer of the connection
+        :return: None
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                # The rest of a malformed request can not be told apart from the next one, the connection is closed
+                try:
+                    method, path, headers, body = await self.read_request(request_line, reader)
+                except ValueError:
+                    await self.respond(writer, '400 Bad Request', 'bad request\n')
+                    break
+
+                status, content = await self.route(method, path, body)
+                await self.respond(writer, status, content)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(request_line, reader):
+        """
+        Read headers and body of a request
+        :param request_line: first line of the request
+        :param reader: stream reader of the connection
+        :return: a tuple of (method, path, headers, body), ValueError is raised if the request is malformed
+        """
+        method, path = request_line.decode('latin-1').split()[:2]
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length < 0:
+            raise ValueError('Negative Content-Length: %d' % length)
+        return method, path, headers, await reader.readexactly(length)
+
+    async def route(self, method, path, body):
+        """
+        Answer a request
+        :param method: HTTP method
+        :param path: request path
+        :param body: request body
+        :return: a tuple of (status, content)
+        """
+        if method == 'POST' and path == '/segment':
+            try:
+                lines = body.decode('utf-8').splitlines()
+            except UnicodeDecodeError:
+                return '400 Bad Request', 'body is not valid UTF-8\n'
+            try:
+                results = await asyncio.gather(*[self.batcher.submit(line.strip()) for line in lines])
+            except Exception as e:
+                print('Segmentation failed:', repr(e), file=sys.stderr)
+                return '500 Internal Server Error', 'segmentation failed\n'
+            return '200 OK', ''.join(results)
+        if method == 'GET' and path == '/health':
+            return '200 OK', 'ok\n'
+        if method == 'GET' and path == '/stats':
+            return '200 OK', self.get_stats()
+        return '404 Not Found', 'not found\n'
+
+    @staticmethod
+    async def respond(writer, status, content):
+        """
+        Write a response
+        :param writer: stream writer of the connection
+        :param status: HTTP status
+        :param content: text of response body
+        :return: None
+        """
+        content = content.encode('utf-8')
+        writer.write(('HTTP/1.1 %s\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Length: %d\r\n\r\n'
+                      % (status, len(content))).encode('latin-1') + content)
+        await writer.drain()
+
+    def get_stats(self):
+        """
+        Get statistics of the result cache
+        :return: a line of hits, misses and hit rate
+        """
+        result_cache = self.segmenter.result_cache
+        if result_cache is None:
+            return 'result cache disabled\n'
+        return 'hits %d misses %d hit_rate %.4f\n' % (result_cache.hits, result_cache.misses, result_cache.hit_rate())
+
+    async def serve(self, host=SERVE_HOST, port=SERVE_PORT, unix_socket=None):
+        """
+        Serve forever on a TCP port or a Unix socket
+        :param host: host to listen on
+        :param port: TCP port to listen on
+        :param unix_socket: path of Unix socket to listen on instead of TCP, if given
+        :return: None
+        """
+        self.batcher = MicroBatcher(self.segmenter.format_batch, self.batch_size, self.max_wait)
+        batcher_task = asyncio.ensure_future(self.batcher.run())
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_socket)
+            print('Serving on unix socket', unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print('Serving on', '%s:%d' % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+def serve(model_name, structured, bundle=False, host=SERVE_HOST, port=SERVE_PORT, unix_socket=None,
+          batch_size=SERVE_BATCH_SIZE, max_wait=SERVE_MAX_WAIT, lexicon_path=None, cache_size=0,
+          normalization=NORMALIZATION):
+    """
+    Load a saved model once and serve segmentation requests
+    :param model_name: model to be used
+    :param structured: the model is a structured perceptron
+    :param bundle: load vocabulary and model from the model bundle
+    :param host: host to listen on
+    :param port: TCP port to listen on
+    :param unix_socket: path of Unix socket to listen on instead of TCP, if given
+    :param batch_size: max number of sentences segmented together
+    :param max_wait: max seconds a sentence waits for a batch to be filled
+    :param lexicon_path: path of user lexicon, words of it are never split
+    :param cache_size: if positive, results of at most *cache_size* recent sentences are cached
+    :param normalization: normalization steps applied before feature extraction
+    :return: None
+    """
+    print('--------', 'Loading vocabulary', '--------')
+    segmenter = Segmenter(model_name, structured, bundle, lexicon_path=lexicon_path, cache_size=cache_size,
+                          normalization=normalization, verbose=True)
+    server = SegmentationServer(segmenter, batch_size, max_wait)
+    asyncio.run(server.serve(host, port, unix_socket))
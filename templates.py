@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: templates.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+
+
+def compile_templates(templates=FEATURE_TEMPLATES, normalize=None):
+    """
+    Compile feature templates into a function extracting feature keys of a text.
+    The key of template *k* is its number followed by the characters at its offsets, like '4_a_b'
+    :param templates: a list of tuples of character offsets relative to current character
+    :param normalize: a function normalizing characters before keys are built, must keep the length of text
+    :return: a function extract(text, begin=0, end=None) returning a list of keys of every
+             character in text[begin:end] for each template
+    """
+    width = max(abs(offset) for template in templates for offset in template)
+    offsets = sorted(set(offset for template in templates for offset in template))
+    compiled = [('%d_' % (k + 1), template) for k, template in enumerate(templates)]
+
+    def extract(text, begin=0, end=None):
+        end = len(text) if end is None else end
+        length = end - begin
+
+        # Characters out of *text* are begin and end marks, the ones out of the window are kept as context
+        context = text[max(begin - width, 0):min(end + width, len(text))]
+        if normalize is not None:
+            context = normalize(context)
+        padded = '^' * max(width - begin, 0) + context + '$' * max(end + width - len(text), 0)
+
+        # Every offset is sliced once and shared by all templates using it
+        windows = dict((offset, padded[width + offset:width + offset + length]) for offset in offsets)
+
+        columns = list()
+        for prefix, template in compiled:
+            if len(template) == 1:
+                columns.append([prefix + char for char in windows[template[0]]])
+            else:
+                columns.append([prefix + '_'.join(chars) for chars in zip(*[windows[offset] for offset in template])])
+        return columns
+
+    return extract
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: conftest.py
+# @Project: ZHWordSegmentation
+
+import os
+import sys
+
+# Modules of the project are imported from the project directory, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constant import *
+from vocab import Vocab
+from dataset import Dataset
+from benchmark import generate_corpus
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='session')
+def corpus():
+    """
+    A small synthetic corpus whose features are added into a fresh vocabulary
+    :return: a tuple of (dataset, list of (features, labels, words))
+    """
+    dataset = Dataset('keyboard', vocab=Vocab([UNKNOWN]))
+    sentences = [dataset.parse_line(line, build=True) for line in generate_corpus(3000, seed=1)]
+    return dataset, sentences
+
+
+def random_weights(model, seed=0):
+    """
+    Give a model random weights and transitions, so that scores never tie
+    :param model: a Perceptron or StructuredPerceptron
+    :param seed: random seed
+    :return: *model*
+    """
+    rand = np.random.RandomState(seed)
+    model.theta = rand.normal(size=model.theta.shape).astype(model.theta.dtype)
+    if hasattr(model, 'transitions'):
+        model.transitions = rand.normal(size=(2, 2)).astype(model.transitions.dtype)
+    return model
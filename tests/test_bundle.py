@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_bundle.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from model import Perceptron, StructuredPerceptron
+from bundle import save_bundle, load_bundle
+from conftest import random_weights
+
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('model_class', [Perceptron, StructuredPerceptron])
+def test_bundle_round_trip(corpus, tmp_path, model_class):
+    dataset, sentences = corpus
+    model = random_weights(model_class(dataset.vocab.size()))
+    path = str(tmp_path / 'model.bundle')
+    save_bundle(path, dataset.vocab, model, normalization=['nfkc', 'digit'])
+    vocab, loaded = load_bundle(path)
+
+    keys = [dataset.vocab.get_word(i) for i in range(dataset.vocab.size())]
+    indexes = vocab.get_indexes(keys + ['not a key'])
+    assert indexes == [vocab.get_index(key) for key in keys + ['not a key']]
+    assert indexes[-1] == vocab.get_index(UNKNOWN)
+    assert [vocab.get_word(i) for i in indexes[:-1]] == keys
+    np.testing.assert_array_equal(loaded.theta[indexes[:-1]], model.theta)
+    if model_class is StructuredPerceptron:
+        np.testing.assert_array_equal(loaded.transitions, model.transitions)
+    assert vocab.normalization == ['nfkc', 'digit']
+
+
+def test_pruned_bundle(corpus, tmp_path):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    path = str(tmp_path / 'model.bundle')
+    save_bundle(path, dataset.vocab, model, threshold=1.0)
+    vocab, loaded = load_bundle(path)
+
+    kept = np.abs(model.theta).max(axis=1) > 1.0
+    kept[dataset.vocab.get_index(UNKNOWN)] = True
+    assert vocab.size() == kept.sum()
+    assert vocab.normalization == []
+    for i in range(dataset.vocab.size()):
+        index = vocab.get_index(dataset.vocab.get_word(i))
+        assert (index != vocab.get_index(UNKNOWN)) == (kept[i] and i != dataset.vocab.get_index(UNKNOWN))
+        if kept[i]:
+            np.testing.assert_array_equal(loaded.theta[index], model.theta[i])
+
+
+@pytest.mark.parametrize('bits', [16, 8])
+def test_pruned_and_quantized_bundle(corpus, tmp_path, bits):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    path = str(tmp_path / 'model.bundle')
+    save_bundle(path, dataset.vocab, model, threshold=1.0, bits=bits)
+    vocab, loaded = load_bundle(path)
+
+    kept = np.abs(model.theta).max(axis=1) > 1.0
+    kept[dataset.vocab.get_index(UNKNOWN)] = True
+    quantized = model.quantize(bits)
+    assert loaded.theta.dtype == quantized.theta.dtype
+    assert loaded.scale == quantized.scale
+    np.testing.assert_array_equal(loaded.transitions, quantized.transitions)
+    for i in np.flatnonzero(kept):
+        np.testing.assert_array_equal(loaded.theta[vocab.get_index(dataset.vocab.get_word(i))], quantized.theta[i])
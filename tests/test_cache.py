@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_cache.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from vocab import Vocab
+from dataset import get_cache_name
+from model import StructuredPerceptron
+from train_test import cached_predict, predict_sentences
+from conftest import random_weights
+from cache import FeatureCache, ResultCache
+
+import os
+
+import cache
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    path = tmp_path / 'cache'
+    path.mkdir()
+    monkeypatch.setattr(cache, 'CACHE_PATH', str(path))
+    return path
+
+
+def build(name, data_path, vocab, normalization=()):
+    """
+    Build a feature cache with fake features, a feature per character whose index is its position
+    :return: the loaded FeatureCache
+    """
+    feature_cache = FeatureCache(name, data_path, vocab, normalization)
+    if not feature_cache.exists():
+        data_file = open(data_path, 'r', encoding='utf-8')
+        feature_cache.build(([(i,) for i in range(len(''.join(line.split())))], [1] * len(''.join(line.split())))
+                            for line in data_file)
+        data_file.close()
+    feature_cache.load()
+    return feature_cache
+
+
+def test_feature_cache_round_trip(tmp_path, cache_path):
+    data_path = str(tmp_path / 'data.txt')
+    open(data_path, 'w', encoding='utf-8').write('今天  天气\n\n很  好\n')
+    feature_cache = build('test', data_path, Vocab([UNKNOWN]))
+
+    assert len(feature_cache) == 3
+    features, labels = feature_cache[0]
+    np.testing.assert_array_equal(features, [[0], [1], [2], [3]])
+    assert labels == [1, 1, 1, 1]
+    assert len(feature_cache[1][0]) == 0
+
+
+def test_feature_cache_is_invalidated(tmp_path, cache_path):
+    data_path = str(tmp_path / 'data.txt')
+    open(data_path, 'w', encoding='utf-8').write('今天  天气\n')
+    vocab = Vocab([UNKNOWN])
+    build('test', data_path, vocab)
+    assert FeatureCache('test', data_path, vocab).exists()
+
+    # Any change of the data file, the vocabulary or feature extraction gives another key
+    assert not FeatureCache('test', data_path, vocab, ['digit']).exists()
+    vocab.add('0_今')
+    assert not FeatureCache('test', data_path, vocab).exists()
+    open(data_path, 'w', encoding='utf-8').write('今天  天气  好\n')
+    assert not FeatureCache('test', data_path, vocab).exists()
+
+    # Building the new cache removes the stale one of the same dataset
+    build('test', data_path, vocab)
+    assert len(os.listdir(str(cache_path))) == 1
+
+
+def test_custom_data_file_has_its_own_cache(tmp_path, cache_path):
+    data_path = str(tmp_path / 'data.txt')
+    other_path = str(tmp_path / 'other.txt')
+    open(data_path, 'w', encoding='utf-8').write('今天  天气\n')
+    open(other_path, 'w', encoding='utf-8').write('很  好\n')
+    vocab = Vocab([UNKNOWN])
+
+    assert get_cache_name('test') == 'test'
+    assert get_cache_name('test', other_path) != get_cache_name('test', data_path)
+    build(get_cache_name('test'), data_path, vocab)
+    build(get_cache_name('test', other_path), other_path, vocab)
+    assert FeatureCache(get_cache_name('test'), data_path, vocab).exists()
+
+
+def test_result_cache_evicts_least_recently_used():
+    result_cache = ResultCache(2)
+    result_cache.put('今天', [0, 1])
+    result_cache.put('天气', [0, 1])
+    assert result_cache.get('今天') == [0, 1]
+    result_cache.put('很好', [1, 1])
+
+    # '天气' is the least recently used one
+    assert len(result_cache) == 2
+    assert result_cache.get('天气') is None
+    assert result_cache.get('很好') == [1, 1]
+    assert result_cache.get('今天') == [0, 1]
+    assert (result_cache.hits, result_cache.misses) == (3, 1)
+    assert result_cache.hit_rate() == 0.75
+
+    result_cache = ResultCache(0)
+    result_cache.put('今天', [0, 1])
+    assert result_cache.get('今天') is None
+    assert result_cache.hit_rate() == 0.0
+
+
+def test_cached_predict_counts_repeats(corpus):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    texts = [''.join(words) for features, labels, words in sentences[:10]]
+    result_cache = ResultCache(100)
+
+    # Repeats inside a batch are decoded once
+    batch = texts[:5] + texts[:3]
+    assert cached_predict(model, dataset, batch, result_cache) == predict_sentences(model, dataset, batch)
+    assert (result_cache.hits, result_cache.misses, len(result_cache)) == (3, 5, 5)
+    assert cached_predict(model, dataset, texts, result_cache) == predict_sentences(model, dataset, texts)
+    assert (result_cache.hits, result_cache.misses, len(result_cache)) == (8, 10, 10)
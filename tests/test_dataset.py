@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_dataset.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from vocab import Vocab
+from dataset import Dataset, RaggedArray, SentenceWords
+
+import cache
+import numpy as np
+import pytest
+
+
+def write_lines(path, lines):
+    """
+    Write a data file
+    :param path: path of file
+    :param lines: a list of lines of separated words
+    :return: *path*
+    """
+    data_file = open(path, 'w', encoding='utf-8')
+    data_file.write(''.join(line + '\n' for line in lines))
+    data_file.close()
+    return path
+
+
+def test_vocabulary_grows(tmp_path):
+    vocab = Vocab([UNKNOWN])
+    Dataset('train', stream=True, vocab=vocab, grow=True, data_path=write_lines(str(tmp_path / 'train.txt'),
+                                                                                ['今天  天气  很  好']))
+    keys = [vocab.get_word(i) for i in range(vocab.size())]
+
+    update_dataset = Dataset('update', vocab=vocab, grow=True,
+                             data_path=write_lines(str(tmp_path / 'update.txt'), ['明天  天气  很  好']))
+    assert vocab.size() > len(keys)
+    assert [vocab.get_word(i) for i in range(len(keys))] == keys
+    assert '1_明' in [vocab.get_word(i) for i in range(len(keys), vocab.size())]
+    features, labels, words = next(iter(update_dataset))
+    assert all(index != vocab.get_index(UNKNOWN) for feature_list in features for index in feature_list)
+
+
+def test_ragged_array():
+    rows = [np.array([[1, 2], [3, 4]]), np.zeros((0, 2)), np.array([[5, 6]])]
+    ragged = RaggedArray.pack(rows, (0, 2), np.int32)
+    assert len(ragged) == 3
+    assert ragged.values.dtype == np.int32
+    for row, packed in zip(rows, ragged):
+        np.testing.assert_array_equal(packed, row)
+    np.testing.assert_array_equal(ragged[-1], [[5, 6]])
+    assert [len(row) for row in ragged[1:]] == [0, 1]
+
+    # Rows are views of the flat array
+    assert ragged[0].base is ragged.values
+    assert len(RaggedArray.pack([], (0, 2), np.int32)) == 0
+
+
+def test_sentence_words():
+    labels = RaggedArray.pack([np.array([0, 1, 0, 1, 1], dtype=np.uint8), np.zeros(0, dtype=np.uint8),
+                               np.array([0, 1], dtype=np.uint8)], (0,), np.uint8)
+    words = SentenceWords(['今天天气好', '', '很好'], labels)
+    assert len(words) == 3
+    assert list(words) == [['今天', '天气', '好'], [], ['很好']]
+    assert words[1:] == [[], ['很好']]
+
+
+def test_dataset_is_packed(corpus, tmp_path):
+    dataset, sentences = corpus
+    path = write_lines(str(tmp_path / 'test.txt'), ['  '.join(words) for features, labels, words in sentences])
+    test_dataset = Dataset('test', vocab=dataset.vocab, data_path=path)
+
+    assert isinstance(test_dataset.features, RaggedArray)
+    assert len(test_dataset.features) == len(sentences)
+    for (features, labels, words), (packed_features, packed_labels, packed_words) in zip(sentences, test_dataset):
+        np.testing.assert_array_equal(packed_features, np.asarray(features).reshape(-1, len(FEATURE_TEMPLATES)))
+        np.testing.assert_array_equal(packed_labels, labels)
+        assert packed_words == words
+
+
+def test_pipeline_keeps_order(corpus, tmp_path):
+    dataset, sentences = corpus
+    lines = ['  '.join(words) for features, labels, words in sentences] * 30
+    path = write_lines(str(tmp_path / 'train.txt'), lines)
+
+    for stream in (False, True):
+        train_dataset = Dataset('train', stream, vocab=dataset.vocab, data_path=path, extractors=3)
+        for epoch in range(2):
+            assert [words for features, labels, words in train_dataset] == [line.split() for line in lines]
+        for (features, labels, words), (expected, expected_labels, expected_words) in zip(train_dataset,
+                                                                                           sentences * 30):
+            np.testing.assert_array_equal(np.asarray(features).reshape(-1, len(FEATURE_TEMPLATES)),
+                                          np.asarray(expected).reshape(-1, len(FEATURE_TEMPLATES)))
+
+
+def test_pipeline_passes_errors(corpus, tmp_path, monkeypatch):
+    dataset, sentences = corpus
+    train_dataset = Dataset('train', vocab=dataset.vocab, data_path=str(tmp_path / 'missing.txt'), extractors=2)
+    with pytest.raises(OSError):
+        list(train_dataset)
+
+    parse_line = Dataset.parse_line
+
+    def broken_parse_line(self, line, build=False):
+        if line.startswith('坏'):
+            raise RuntimeError('broken line')
+        return parse_line(self, line, build)
+
+    monkeypatch.setattr(Dataset, 'parse_line', broken_parse_line)
+    path = write_lines(str(tmp_path / 'train.txt'), ['今天  天气'] * 1000 + ['坏'])
+    train_dataset = Dataset('train', vocab=dataset.vocab, data_path=path, extractors=2)
+    with pytest.raises(RuntimeError):
+        list(train_dataset)
+
+
+def test_feature_cache_is_built_by_extractors(corpus, tmp_path, monkeypatch):
+    dataset, sentences = corpus
+    monkeypatch.setattr(cache, 'CACHE_PATH', str(tmp_path))
+    path = write_lines(str(tmp_path / 'train.txt'), ['  '.join(words) for features, labels, words in sentences])
+
+    cached = Dataset('train', cache=True, vocab=dataset.vocab, data_path=path, extractors=2)
+    assert len(cached.features) == len(sentences)
+    for (features, labels, words), (expected, expected_labels, expected_words) in zip(cached, sentences):
+        np.testing.assert_array_equal(features, np.asarray(expected).reshape(-1, len(FEATURE_TEMPLATES)))
+        assert words == expected_words
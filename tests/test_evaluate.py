@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_evaluate.py
+# @Project: ZHWordSegmentation
+
+from evaluate import get_words, score, print_score, EarlyStopping
+
+import pytest
+
+
+def test_get_words():
+    assert get_words('今天天气很好', [0, 1, 0, 1, 1, 0]) == ['今天', '天气', '很', '好']
+    assert get_words('', []) == []
+
+
+def test_score():
+    pred = [['今天', '天', '气', '很好'], ['北京']]
+    gold = [['今天', '天气', '很', '好'], ['北京']]
+    precision, recall, f, oov_recall, iv_recall = score(pred, gold)
+    assert precision == pytest.approx(2 / 5)
+    assert recall == pytest.approx(2 / 5)
+    assert f == pytest.approx(2 / 5)
+    assert oov_recall is None and iv_recall is None
+
+    precision, recall, f, oov_recall, iv_recall = score(pred, gold, {'今天', '天气', '北京'})
+    assert oov_recall == pytest.approx(0 / 2)
+    assert iv_recall == pytest.approx(2 / 3)
+
+
+def test_score_without_oov_words(capsys):
+    result = score([['今天', '天气']], [['今天', '天气']], {'今天', '天气'})
+    assert result == (1.0, 1.0, 1.0, None, 1.0)
+    print_score(result)
+    assert capsys.readouterr().out == 'P 1.0000  R 1.0000  F 1.0000  OOV-R n/a  IV-R 1.0000\n'
+
+    print_score(score([['今天', '天气']], [['今天', '天气']]))
+    assert capsys.readouterr().out == 'P 1.0000  R 1.0000  F 1.0000\n'
+
+
+def test_early_stopping():
+    stopping = EarlyStopping(2, delta=0.01)
+    assert stopping.update(0.90)
+    assert stopping.update(0.92)
+    assert not stopping.update(0.925)
+    assert not stopping.stop()
+    assert not stopping.update(0.80)
+    assert stopping.stop()
+    assert stopping.best == 0.92
+
+    restored = EarlyStopping(2, delta=0.01)
+    restored.set_state(stopping.get_state())
+    assert restored.stop()
+    assert restored.update(0.95)
+    assert not restored.stop()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_lexicon.py
+# @Project: ZHWordSegmentation
+
+from lexicon import Lexicon
+
+import random
+
+import pytest
+
+
+def random_lexicon_and_text(seed):
+    """
+    Generate a lexicon of overlapping words over a small alphabet, and a text full of their matches
+    :param seed: random seed
+    :return: a tuple of (lexicon, text)
+    """
+    rand = random.Random(seed)
+    alphabet = '甲乙丙丁戊'
+    words = [''.join(rand.choice(alphabet) for _ in range(rand.randint(1, 6))) for _ in range(30)]
+    text = ''.join(rand.choice(words + list(alphabet)) for _ in range(300))
+    return Lexicon(words), text
+
+
+def test_match_is_leftmost_longest():
+    lexicon = Lexicon(['北京', '北京大学', '大学生', '学生'])
+    assert lexicon.match('北京大学生活') == [(0, 4)]
+    assert lexicon.get_constraints('在北京大学生活') == [1, 0, 0, 0, 1, -1, -1]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 8, 13, 1000])
+def test_chunk_constraints_equal_constraints(seed, size):
+    lexicon, text = random_lexicon_and_text(seed)
+    chunks = list(lexicon.get_chunk_constraints(text, size))
+    assert [len(chunk) for chunk in chunks] == [min(size, len(text) - begin) for begin in range(0, len(text), size)]
+    assert [label for chunk in chunks for label in chunk] == lexicon.get_constraints(text)
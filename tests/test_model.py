@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_model.py
+# @Project: ZHWordSegmentation
+
+from model import Perceptron, StructuredPerceptron, grow_weights, mix_states, save_checkpoint, load_checkpoint
+from conftest import random_weights
+
+import copy
+
+import numpy as np
+import pytest
+
+
+def random_constraints(sentences, seed=0):
+    """
+    Force random labels of about a tenth of the characters
+    :param sentences: a list of (features, labels, words)
+    :param seed: random seed
+    :return: a list of forced labels of each sentence
+    """
+    rand = np.random.RandomState(seed)
+    return [np.where(rand.rand(len(features)) < 0.1, rand.randint(0, 2, len(features)), -1).tolist()
+            for features, labels, words in sentences]
+
+
+@pytest.mark.parametrize('bits', [32, 8])
+@pytest.mark.parametrize('forced', [False, True])
+def test_predict_batch_equals_predict(corpus, bits, forced):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    model = model if bits == 32 else model.quantize(bits)
+    features = [sentence_features for sentence_features, labels, words in sentences]
+    constraints = random_constraints(sentences) if forced else [None] * len(sentences)
+
+    preds = model.predict_batch(features, 64, constraints if forced else None)
+    assert preds == [model.predict(sentence_features, sentence_constraints)
+                     for sentence_features, sentence_constraints in zip(features, constraints)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 100])
+def test_predict_stream_equals_predict(corpus, size):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    features = [feature for sentence_features, labels, words in sentences for feature in sentence_features]
+    constraints = [label for sentence_constraints in random_constraints(sentences) for label in sentence_constraints]
+
+    chunks = [features[begin:begin + size] for begin in range(0, len(features), size)]
+    chunk_constraints = [constraints[begin:begin + size] for begin in range(0, len(features), size)]
+    preds = [tag for tags in model.predict_stream(chunks) for tag in tags]
+    assert preds == model.predict(features)
+    preds = [tag for tags in model.predict_stream(chunks, chunk_constraints) for tag in tags]
+    assert preds == model.predict(features, constraints)
+
+
+def test_update_sentence_equals_update(corpus):
+    dataset, sentences = corpus
+    by_sentence = Perceptron(dataset.vocab.size())
+    by_character = Perceptron(dataset.vocab.size())
+    for features, labels, words in sentences * 2:
+        by_sentence.update_sentence(features, labels)
+        for feature_list, label in zip(features, labels):
+            by_character.update(feature_list, label)
+
+    by_sentence.accumulate()
+    by_character.accumulate()
+    assert by_sentence.total_step == by_character.total_step
+    np.testing.assert_array_equal(by_sentence.theta, by_character.theta)
+    np.testing.assert_array_equal(by_sentence.theta_sum, by_character.theta_sum)
+
+
+def train_copy(model, sentences):
+    """
+    Train a copy of a model on some sentences, as a worker of mixed training does
+    :return: training state of the copy
+    """
+    model = copy.deepcopy(model)
+    for features, labels, words in sentences:
+        if isinstance(model, StructuredPerceptron):
+            model.update(features, labels)
+        else:
+            model.update_sentence(features, labels)
+    return model.get_state()
+
+
+@pytest.mark.parametrize('model_class', [Perceptron, StructuredPerceptron])
+def test_mix_states(corpus, model_class):
+    dataset, sentences = corpus
+    model = model_class(dataset.vocab.size())
+    model.set_state(train_copy(model, sentences[:50]))
+    model.accumulate()
+    base = copy.deepcopy(model.get_state())
+    states = [train_copy(model, sentences[50::2]), train_copy(model, sentences[51::2])]
+    mixed = mix_states(base, states)
+
+    steps = sum(state['total_step'] - base['total_step'] for state in states)
+    assert mixed['total_step'] == base['total_step'] + steps
+    assert set(mixed) == set(base)
+    for key in base:
+        if key.endswith('last_update'):
+            assert (mixed[key] == mixed['total_step']).all()
+        elif key.endswith('_sum'):
+            np.testing.assert_allclose(mixed[key], base[key] + mixed[key[:-len('_sum')]] * steps)
+        elif key != 'total_step':
+            assert mixed[key].dtype == base[key].dtype
+            np.testing.assert_allclose(mixed[key], (states[0][key] + states[1][key]) / 2, rtol=1e-6)
+
+    # A single model is left as it is
+    mixed = mix_states(base, states[:1])
+    for key in ('theta', 'transitions'):
+        if key in base:
+            np.testing.assert_array_equal(mixed[key], states[0][key])
+    assert mixed['total_step'] == states[0]['total_step']
+
+
+@pytest.mark.parametrize('model_class', [Perceptron, StructuredPerceptron])
+def test_resume_from_checkpoint(corpus, tmp_path, model_class):
+    dataset, sentences = corpus
+    uninterrupted = model_class(dataset.vocab.size())
+    uninterrupted.set_state(train_copy(uninterrupted, sentences * 2))
+
+    interrupted = model_class(dataset.vocab.size())
+    interrupted.set_state(train_copy(interrupted, sentences))
+    save_checkpoint(interrupted, str(tmp_path / 'model.checkpoint'), 1)
+    resumed = model_class(dataset.vocab.size())
+    assert load_checkpoint(resumed, str(tmp_path / 'model.checkpoint')) == 1
+    resumed.set_state(train_copy(resumed, sentences))
+
+    for key, value in uninterrupted.get_state().items():
+        np.testing.assert_array_equal(resumed.get_state()[key], value)
+    if model_class is Perceptron:
+        np.testing.assert_array_equal(resumed.get_average(), uninterrupted.get_average())
+    else:
+        for resumed_average, average in zip(resumed.get_average(), uninterrupted.get_average()):
+            np.testing.assert_array_equal(resumed_average, average)
+
+
+def test_grow_weights():
+    theta = np.arange(6, dtype=np.float32).reshape(3, 2)
+    grown = grow_weights(theta, 5, 'model')
+    assert grown.dtype == theta.dtype
+    np.testing.assert_array_equal(grown, [[0, 1], [2, 3], [4, 5], [0, 0], [0, 0]])
+    assert grow_weights(theta, 3, 'model') is theta
+    np.testing.assert_array_equal(grow_weights(np.arange(3), 4, 'model'), [0, 1, 2, 0])
+    with pytest.raises(ValueError):
+        grow_weights(theta, 2, 'model')
+
+
+@pytest.mark.parametrize('model_class', [Perceptron, StructuredPerceptron])
+def test_checkpoint_grows_with_vocabulary(corpus, tmp_path, model_class):
+    dataset, sentences = corpus
+    model = model_class(dataset.vocab.size())
+    model.set_state(train_copy(model, sentences))
+    save_checkpoint(model, str(tmp_path / 'model.checkpoint'), 1)
+
+    grown = model_class(dataset.vocab.size() + 10)
+    assert load_checkpoint(grown, str(tmp_path / 'model.checkpoint')) == 1
+    assert grown.dimension == dataset.vocab.size() + 10
+    for key in ('theta', 'theta_sum', 'last_update'):
+        assert len(grown.get_state()[key]) == grown.dimension
+        np.testing.assert_array_equal(grown.get_state()[key][:model.dimension], model.get_state()[key])
+        assert not grown.get_state()[key][model.dimension:].any()
+
+    # Weights of new features are updated like any other
+    new = grown.dimension - 1
+    extended = [([feature_list[:-1] + (new,) for feature_list in features], labels, words)
+                for features, labels, words in sentences]
+    grown.set_state(train_copy(grown, extended))
+    assert grown.theta[new].any()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_normalize.py
+# @Project: ZHWordSegmentation
+
+from normalize import NORMALIZATION_STEPS, normalize_char, compile_normalizer
+
+import pytest
+
+
+def test_normalize_char():
+    assert normalize_char('Ａ', ['nfkc']) == 'A'
+    assert normalize_char('Ａ', ['nfkc', 'latin']) == 'a'
+    assert normalize_char('Ａ', ['latin']) == 'Ａ'
+    assert normalize_char('７', ['digit']) == '0'
+    assert normalize_char('，', ['punctuation']) == '.'
+    assert normalize_char('中', list(NORMALIZATION_STEPS)) == '中'
+
+
+def test_normalization_keeps_length():
+    # NFKC expands these characters into several ones, they are left as they are
+    text = '㈱ﬁ½…Ａｂ１２３，中文ⅧＶ㎏'
+    for code in range(0x20, 0x3400):
+        assert len(normalize_char(chr(code), list(NORMALIZATION_STEPS))) == 1
+    normalize = compile_normalizer(list(NORMALIZATION_STEPS))
+    assert len(normalize(text)) == len(text)
+    assert normalize(text) == ''.join(normalize_char(char, list(NORMALIZATION_STEPS)) for char in text)
+
+
+def test_unknown_step():
+    assert compile_normalizer([]) is None
+    with pytest.raises(ValueError):
+        compile_normalizer(['nfkc', 'lowercase'])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_output.py
+# @Project: ZHWordSegmentation
+
+from output import format_line, OutputWriter
+
+import gzip
+import json
+
+import pytest
+
+
+def test_plain():
+    assert format_line('今天天气好', [0, 1, 0, 1, 1]) == '今天  天气  好  \n'
+    assert format_line('今天天气好', [0, 1, 0, 1, 0]) == '今天  天气  好\n'
+    assert format_line('', []) == '\n'
+
+
+def test_offsets():
+    assert format_line('今天天气好', [0, 1, 0, 1, 1], 'offsets') == '0,2 2,4 4,5\n'
+    assert format_line('今天天气好', [0, 1, 0, 1, 0], 'offsets') == '0,2 2,4 4,5\n'
+    assert format_line('', [], 'offsets') == '\n'
+
+
+def test_jsonl():
+    line = format_line('今天天气好', [0, 1, 0, 1, 1], 'jsonl')
+    assert line.endswith('\n') and '今天' in line
+    assert json.loads(line) == {'text': '今天天气好', 'words': ['今天', '天气', '好'], 'offsets': [[0, 2], [2, 4], [4, 5]]}
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        format_line('今天', [0, 1], 'xml')
+    with pytest.raises(ValueError):
+        OutputWriter('-', 'xml')
+
+
+@pytest.mark.parametrize('name', ['result.txt', 'result.txt.gz'])
+def test_output_writer(tmp_path, name):
+    path = str(tmp_path / name)
+    output_writer = OutputWriter(path, buffer_size=4)
+    output_writer.write('今天天气', [0, 1, 0, 1])
+    output_writer.write_lines(['好  \n', '\n'])
+    output_writer.close()
+
+    data_file = gzip.open(path, 'rt', encoding='utf-8') if name.endswith('.gz') else open(path, encoding='utf-8')
+    assert data_file.read() == '今天  天气  \n好  \n\n'
+    data_file.close()
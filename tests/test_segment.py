@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_segment.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from model import Perceptron, StructuredPerceptron
+from dataset import Dataset
+from metrics import Metrics
+from lexicon import Lexicon
+from train_test import predict_all, predict_chunks, predict_sentences, predict_buckets, read_windows, get_constraints
+from conftest import random_weights
+
+import itertools
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def text(corpus):
+    dataset, sentences = corpus
+    return ''.join(word for features, labels, words in sentences[:200] for word in words)
+
+
+@pytest.mark.parametrize('model_class', [Perceptron, StructuredPerceptron])
+@pytest.mark.parametrize('size', [3, 4, 17, 100, 1000])
+def test_chunks_equal_whole_text(corpus, text, model_class, size):
+    dataset, sentences = corpus
+    model = random_weights(model_class(dataset.vocab.size()))
+    lexicon = Lexicon(words[0] for features, labels, words in sentences[:50])
+
+    preds = list(itertools.chain.from_iterable(predict_chunks(model, dataset, text, chunk_size=size)))
+    assert preds == predict_all(model, [dataset.generate_features(text)])[0]
+    preds = list(itertools.chain.from_iterable(predict_chunks(model, dataset, text, lexicon, size)))
+    assert preds == predict_all(model, [dataset.generate_features(text)], get_constraints(lexicon, [text]))[0]
+
+
+def test_long_sentences_equal_batch(corpus, text):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    texts = [''.join(words) for features, labels, words in sentences[:20]] + [text * 2]
+    assert len(texts[-1]) > CHUNK_SIZE
+
+    preds = predict_sentences(model, dataset, texts)
+    assert preds == predict_all(model, [dataset.generate_features(sentence) for sentence in texts])
+
+
+def test_long_lines_are_not_extracted(corpus, text, tmp_path):
+    dataset, sentences = corpus
+    path = str(tmp_path / 'input.txt')
+    open(path, 'w', encoding='utf-8').write('今天  天气\n' + text * 2 + '\n\n很  好\n')
+    test_dataset = Dataset('test', stream=True, vocab=dataset.vocab, data_path=path)
+
+    windows = list(read_windows(test_dataset, Metrics(), 3))
+    assert [sentences for sentences, features in windows] == [['今天天气', text * 2, ''], ['很好']]
+    assert windows[0][1][0] == dataset.generate_features('今天天气')
+    assert windows[0][1][1] is None
+
+
+def test_buckets_equal_batch(corpus):
+    dataset, sentences = corpus
+    model = random_weights(StructuredPerceptron(dataset.vocab.size()))
+    texts = [''.join(words) for features, labels, words in sentences] * 8
+    features = [sentence_features for sentence_features, labels, words in sentences] * 8
+    assert len(texts) > BATCH_SIZE
+    metrics = Metrics()
+
+    assert predict_buckets(model, dataset, texts, features, metrics=metrics) == predict_all(model, features)
+    assert len(metrics.samples['decode_batch_latency']) == (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
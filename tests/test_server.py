@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_server.py
+# @Project: ZHWordSegmentation
+
+from server import MicroBatcher, SegmentationServer
+from output import format_line
+
+import asyncio
+
+
+class CharSegmenter(object):
+    """
+    A segmenter splitting texts into characters, it fails on texts containing '坏'
+    """
+    result_cache = None
+
+    def format_batch(self, texts, output_format='plain'):
+        if any('坏' in text for text in texts):
+            raise RuntimeError('broken model')
+        return [format_line(text, [1] * len(text), output_format) for text in texts]
+
+
+def request(raw_requests):
+    """
+    Send raw requests through a connection to a server of a CharSegmenter
+    :param raw_requests: bytes of requests
+    :return: bytes received until the server closes the connection
+    """
+    async def run():
+        server = SegmentationServer(CharSegmenter())
+        server.batcher = MicroBatcher(server.segmenter.format_batch, 4, 0.001)
+        batcher_task = asyncio.ensure_future(server.batcher.run())
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        writer.write(raw_requests)
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        listener.close()
+        batcher_task.cancel()
+        return response
+
+    return asyncio.run(run())
+
+
+def post(body, connection='close'):
+    return (b'POST /segment HTTP/1.1\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+            % (len(body), connection.encode()) + body)
+
+
+def test_segment_in_test_format():
+    response = request(post('今天\n好\n'.encode('utf-8')))
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert response.endswith('今  天  \n好  \n'.encode('utf-8'))
+
+
+def test_bad_requests():
+    assert request(post(b'\xff\xfe')).startswith(b'HTTP/1.1 400 Bad Request\r\n')
+    response = request(b'POST /segment HTTP/1.1\r\nContent-Length: many\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+    assert request(b'GARBAGE\r\n\r\n').startswith(b'HTTP/1.1 400 Bad Request\r\n')
+
+
+def test_failed_segmentation_keeps_connection():
+    health = b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n'
+    response = request(post('坏\n'.encode('utf-8'), 'keep-alive') + health)
+    assert response.startswith(b'HTTP/1.1 500 Internal Server Error\r\n')
+    assert response.endswith(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Length: 3\r\n\r\n'
+                              b'ok\n')
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @File: test_templates.py
+# @Project: ZHWordSegmentation
+
+from constant import *
+from templates import compile_templates
+from benchmark import generate_corpus
+
+import pytest
+
+
+def extract_line(line):
+    """
+    Extract feature keys of a line of separated words as the hand-written templates did before they were compiled
+    :param line: a line of separated words
+    :return: a list of keys of every character, one for each template
+    """
+    keys = list()
+    text = '^' + line.strip() + '$'
+    for i in range(len(text)):
+        if text[i] == ' ' or text[i] == '^' or text[i] == '$':
+            continue
+        prev = i - 1
+        next = i + 1
+        while text[prev] in SPACE:
+            prev -= 1
+        while text[next] in SPACE:
+            next += 1
+        keys.append((
+            '_'.join((str(1), text[prev])),
+            '_'.join((str(2), text[i])),
+            '_'.join((str(3), text[next])),
+            '_'.join((str(4), text[prev], text[i])),
+            '_'.join((str(5), text[i], text[next])),
+            '_'.join((str(6), text[prev], text[next])),
+            '_'.join((str(7), text[prev], text[i], text[next]))
+        ))
+    return keys
+
+
+def test_keys_equal_hand_written_templates():
+    extract = compile_templates(FEATURE_TEMPLATES)
+    for line in generate_corpus(2000, seed=2) + ['我', '他  说  ：  “  Hello  ，  world  2024  ！  ”', '']:
+        assert list(zip(*extract(''.join(line.split())))) == extract_line(line)
+
+
+@pytest.mark.parametrize('begin, end', [(0, 1), (0, 5), (1, 2), (3, 9), (8, 10), (9, 10), (4, 4)])
+def test_window_keys_equal_whole_text(begin, end):
+    extract = compile_templates(FEATURE_TEMPLATES)
+    text = '今天天气很好，我们去'
+    assert [column[begin:end] for column in extract(text)] == extract(text, begin, end)
@@ -6,165 +6,919 @@
 # @Project: ZHWordSegmentation
 
 from constant import *
-from model import Perceptron, StructuredPerceptron
-from dataset import Dataset
+from model import Perceptron, StructuredPerceptron, mix_states, save_checkpoint, load_checkpoint
+from dataset import Dataset, batched, get_fork_context
+from cache import ResultCache
+from bundle import save_bundle, load_bundle
+from evaluate import get_words, score, load_words, load_dictionary, print_score, EarlyStopping
+from metrics import Metrics
+from lexicon import load_lexicon
+from normalize import NORMALIZATION_STEPS
+from vocab import Vocab
+from output import OutputWriter, open_text, format_line
 
+import copy
+import itertools
+import sys
+import tempfile
+import time
 
-def train(model_name, average):
+import numpy as np
+
+
+def load_dataset_and_model(name, model_class, model_name, bundle, stream=False, cache=False, data_path=None,
+                           normalization=None):
+    """
+    Load a dataset and a saved model, either from vocabulary and model files or from a model bundle
+    :param name: name of dataset
+    :param model_class: Perceptron or StructuredPerceptron
+    :param model_name: model to be used
+    :param bundle: load vocabulary and model from the model bundle
+    :param stream: read dataset lazily instead of keeping it in memory
+    :param cache: use the on-disk feature cache
+    :param data_path: read dataset from this file instead of the default one of *name*
+    :param normalization: normalization steps applied before feature extraction, default are the steps given to
+                          *set_normalization*, they must be the steps the vocabulary or the bundle was built with
+    :return: a tuple of (dataset, model)
+    """
+    if bundle:
+        vocab, model = load_bundle(os.path.join(MODEL_SAVE_PATH, model_name + BUNDLE_SUFFIX))
+        return Dataset(name, stream, cache, vocab, normalization=normalization, data_path=data_path), model
+
+    dataset = Dataset(name, stream, cache, normalization=normalization, data_path=data_path)
+    model = model_class(dataset.vocab.size())
+    model.load(os.path.join(MODEL_SAVE_PATH, model_name))
+    return dataset, model
+
+
+def export_bundle(model_name, model_class, threshold=None, bits=32):
+    """
+    Pack vocabulary and a saved model into a model bundle
+    :param model_name: model to be exported
+    :param model_class: Perceptron or StructuredPerceptron
+    :param threshold: if given, drop features whose absolute weight is not above *threshold*
+    :param bits: 32 to keep float weights, 16 or 8 to quantize weights
+    :return: None
+    """
+    print('--------', 'Loading vocabulary', '--------')
+    dataset, model = load_dataset_and_model('keyboard', model_class, model_name, False)
+    save_bundle(os.path.join(MODEL_SAVE_PATH, model_name + BUNDLE_SUFFIX), dataset.vocab, model, threshold, bits,
+                dataset.normalization)
+
+
+def predict_all(model, sentences_features, constraints=None):
+    """
+    Get predictions of many sentences with either kind of model
+    :param model: a Perceptron or StructuredPerceptron
+    :param sentences_features: a list of features of input sentences
+    :param constraints: a list of forced labels of each sentence, or None
+    :return: a list of lists of 0/1 predictions
+    """
+    if isinstance(model, StructuredPerceptron):
+        return model.predict_batch(sentences_features, BATCH_SIZE, constraints)
+    if constraints is None:
+        return [model.predict_sentence(features) for features in sentences_features]
+    return [model.predict_sentence(features, forced) for features, forced in zip(sentences_features, constraints)]
+
+
+def get_constraints(lexicon, sentences):
+    """
+    Get forced labels of sentences by matching words of a user lexicon
+    :param lexicon: a Lexicon, or None
+    :param sentences: a list of input sentences
+    :return: a list of forced labels of each sentence, or None if there is no lexicon
+    """
+    if lexicon is None:
+        return None
+    return [lexicon.get_constraints(sentence) for sentence in sentences]
+
+
+def predict_chunks(model, dataset, text, lexicon=None, chunk_size=CHUNK_SIZE):
+    """
+    Get predictions of a long text with bounded memory, features and forced labels are generated chunk by chunk
+    :param model: a Perceptron or StructuredPerceptron
+    :param dataset: dataset whose vocabulary is used to generate features
+    :param text: input text
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param chunk_size: number of characters whose features are generated at a time
+    :return: a generator of lists of 0/1 predictions, concatenated they are the prediction of *text*
+    """
+    chunks = dataset.generate_feature_chunks(text, chunk_size)
+    if lexicon is None:
+        constraints = itertools.repeat(None)
+    else:
+        constraints = lexicon.get_chunk_constraints(text, chunk_size)
+    if isinstance(model, StructuredPerceptron):
+        return model.predict_stream(chunks, constraints)
+    return (model.predict_sentence(features, forced) for features, forced in zip(chunks, constraints))
+
+
+def predict_sentences(model, dataset, sentences, lexicon=None, features=None):
+    """
+    Get predictions of many sentences with either kind of model. Sentences longer than *CHUNK_SIZE* are decoded
+    one by one by *predict_chunks*, so a batch is never padded to their length
+    :param model: a Perceptron or StructuredPerceptron
+    :param dataset: dataset whose vocabulary is used to generate features
+    :param sentences: a list of input sentences
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param features: features of *sentences* if they are generated already, those of long sentences are not used
+    :return: a list of lists of 0/1 predictions
+    """
+    short = [k for k in range(len(sentences)) if len(sentences[k]) <= CHUNK_SIZE]
+    texts = [sentences[k] for k in short]
+    if features is None:
+        short_features = [dataset.generate_features(text) for text in texts]
+    else:
+        short_features = [features[k] for k in short]
+
+    preds = [None] * len(sentences)
+    for k, pred in zip(short, predict_all(model, short_features, get_constraints(lexicon, texts))):
+        preds[k] = pred
+    for k in range(len(sentences)):
+        if preds[k] is None:
+            preds[k] = list(itertools.chain.from_iterable(predict_chunks(model, dataset, sentences[k], lexicon)))
+    return preds
+
+
+def predict_buckets(model, dataset, sentences, features, lexicon=None, metrics=None):
+    """
+    Get predictions of a window of sentences, sentences are sorted by length and decoded in buckets of *BATCH_SIZE*
+    like *predict_batch* does, so the decoding latency of every bucket is observed on its own
+    :param model: a Perceptron or StructuredPerceptron
+    :param dataset: dataset whose vocabulary is used to generate features
+    :param sentences: a list of input sentences
+    :param features: features of *sentences*, those of long sentences are not used
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param metrics: a Metrics observing the latency of every bucket
+    :return: a list of lists of 0/1 predictions
+    """
+    metrics = Metrics() if metrics is None else metrics
+    order = sorted(range(len(sentences)), key=lambda k: len(sentences[k]))
+    preds = [None] * len(sentences)
+    for bucket in batched(order, BATCH_SIZE):
+        begin = time.perf_counter()
+        bucket_preds = predict_sentences(model, dataset, [sentences[k] for k in bucket], lexicon,
+                                         [features[k] for k in bucket])
+        metrics.observe('decode_batch_latency', time.perf_counter() - begin)
+        for k, pred in zip(bucket, bucket_preds):
+            preds[k] = pred
+    return preds
+
+
+def read_windows(test_dataset, metrics, size=DECODE_WINDOW):
+    """
+    Read sentences of test dataset and their features in windows. Features are read from the feature cache if
+    the dataset has one, otherwise they are extracted from raw lines, except for sentences longer than
+    *CHUNK_SIZE*, which are never extracted at once but decoded chunk by chunk by *predict_chunks*
+    :param test_dataset: test dataset
+    :param metrics: a Metrics timing feature extraction
+    :param size: number of sentences of a window
+    :return: a generator of (sentences, features), features of long sentences are None
+    """
+    if test_dataset.cache is not None:
+        for batch in batched(metrics.timed(test_dataset, 'extract'), size):
+            yield [''.join(words) for features, labels, words in batch], [features for features, labels, words in batch]
+        return
+
+    data_file = open_text(test_dataset.data_path, 'r')
+    for lines in batched(data_file, size):
+        sentences = [''.join(line.split()) for line in lines]
+        with metrics.timer('extract'):
+            features = [test_dataset.generate_features(sentence) if len(sentence) <= CHUNK_SIZE else None
+                        for sentence in sentences]
+        yield sentences, features
+    data_file.close()
+
+
+def prune_report(model_name, model_class, thresholds=PRUNE_THRESHOLDS):
+    """
+    Report bundle size and F-score on test dataset of a saved model pruned at several thresholds
+    :param model_name: model to be pruned
+    :param model_class: Perceptron or StructuredPerceptron
+    :param thresholds: pruning thresholds, features whose absolute weight is not above a threshold are dropped
+    :return: a list of (threshold, number of features, bundle size in bytes, f)
+    """
+    print('--------', 'Generating test dataset', '--------')
+    test_dataset, model = load_dataset_and_model('test', model_class, model_name, False)
+    sentences = [''.join(words) for words in test_dataset.words]
+    gold = load_words(TEST_ANSWER)
+    unknown = test_dataset.vocab.get_index(UNKNOWN)
+
+    print('--------', 'Pruning begins', '--------')
+    print('%10s %10s %12s %8s' % ('threshold', 'features', 'bytes', 'F'))
+    report = list()
+    for threshold in [None] + list(thresholds):
+        # A pruned feature is scored like an unknown one, so the pruned model can be simulated on full features
+        pruned = copy.copy(model)
+        if threshold is not None:
+            kept = np.abs(model.theta).max(axis=1) > threshold
+            pruned.theta = np.where(kept[:, None], model.theta, model.theta[unknown])
+        preds = predict_all(pruned, test_dataset.features)
+        f = score([get_words(sentence, pred) for sentence, pred in zip(sentences, preds)], gold)[2]
+
+        bundle_file = tempfile.NamedTemporaryFile(suffix=BUNDLE_SUFFIX, delete=False)
+        bundle_file.close()
+        save_bundle(bundle_file.name, test_dataset.vocab, model, threshold, normalization=test_dataset.normalization)
+        features = load_bundle(bundle_file.name)[0].size()
+        size = os.path.getsize(bundle_file.name)
+        os.remove(bundle_file.name)
+
+        report.append((threshold, features, size, f))
+        print('%10s %10d %12d %8.4f' % ('none' if threshold is None else threshold, features, size, f))
+    print('--------', 'Pruning finished', '--------')
+    return report
+
+
+def quantize_report(model_name, model_class, bits_list=QUANTIZE_BITS):
+    """
+    Report size and F-score on test dataset of a saved model quantized to several numbers of bits,
+    compared with the float model
+    :param model_name: model to be quantized
+    :param model_class: Perceptron or StructuredPerceptron
+    :param bits_list: numbers of bits of quantized weights
+    :return: a list of (bits, weight size in bytes, bundle size in bytes, f, f delta, number of changed labels)
+    """
+    print('--------', 'Generating test dataset', '--------')
+    test_dataset, model = load_dataset_and_model('test', model_class, model_name, False)
+    sentences = [''.join(words) for words in test_dataset.words]
+    gold = load_words(TEST_ANSWER)
+
+    print('--------', 'Quantization begins', '--------')
+    print('%6s %12s %12s %8s %9s %8s' % ('bits', 'weights', 'bytes', 'F', 'delta', 'changed'))
+    report = list()
+    base_preds, base_f = None, None
+    for bits in [32] + list(bits_list):
+        quantized = model if bits == 32 else model.quantize(bits)
+        preds = predict_all(quantized, test_dataset.features)
+        f = score([get_words(sentence, pred) for sentence, pred in zip(sentences, preds)], gold)[2]
+        if base_preds is None:
+            base_preds, base_f = preds, f
+        changed = sum(a != b for pred, base_pred in zip(preds, base_preds) for a, b in zip(pred, base_pred))
+
+        bundle_file = tempfile.NamedTemporaryFile(suffix=BUNDLE_SUFFIX, delete=False)
+        bundle_file.close()
+        save_bundle(bundle_file.name, test_dataset.vocab, model, bits=bits, normalization=test_dataset.normalization)
+        weight_size = load_bundle(bundle_file.name)[1].theta.nbytes
+        size = os.path.getsize(bundle_file.name)
+        os.remove(bundle_file.name)
+
+        report.append((bits, weight_size, size, f, f - base_f, changed))
+        print('%6d %12d %12d %8.4f %+9.4f %8d' % (bits, weight_size, size, f, f - base_f, changed))
+    print('--------', 'Quantization finished', '--------')
+    return report
+
+
+def cached_predict(model, dataset, sentences, result_cache, lexicon=None):
+    """
+    Get predictions of sentences, features are generated and decoded only for sentences not in the result cache
+    :param model: a Perceptron or StructuredPerceptron
+    :param dataset: dataset whose vocabulary is used to generate features
+    :param sentences: a list of input sentences
+    :param result_cache: a ResultCache of predictions
+    :param lexicon: user lexicon forcing boundaries, or None
+    :return: a list of lists of 0/1 predictions
+    """
+    # Repeats inside the batch are looked up and decoded once, they count as hits
+    preds = dict((sentence, result_cache.get(sentence)) for sentence in dict.fromkeys(sentences))
+    result_cache.hits += len(sentences) - len(preds)
+
+    missing = [sentence for sentence, pred in preds.items() if pred is None]
+    for sentence, pred in zip(missing, predict_sentences(model, dataset, missing, lexicon)):
+        preds[sentence] = pred
+        result_cache.put(sentence, pred)
+    return [preds[sentence] for sentence in sentences]
+
+
+def cached_test(test_dataset, model, output_file_path, result_cache, lexicon=None, output_format='plain',
+                metrics=None):
+    """
+    Segment test dataset line by line, repeated lines are answered by the result cache
+    :param test_dataset: test dataset
+    :param model: model to be used
+    :param output_file_path: test result output path
+    :param result_cache: a ResultCache of predictions
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param output_format: format of test result, one of *OUTPUT_FORMATS*
+    :param metrics: a Metrics collecting decoding latencies of batches and counters
+    :return: None
+    """
+    metrics = Metrics() if metrics is None else metrics
+    data_file = open_text(test_dataset.data_path, 'r')
+    output_writer = OutputWriter(output_file_path, output_format)
+    for lines in batched(data_file, DECODE_WINDOW):
+        sentences = [''.join(line.split()) for line in lines]
+        begin = time.perf_counter()
+        preds = cached_predict(model, test_dataset, sentences, result_cache, lexicon)
+        metrics.observe('decode_batch_latency', time.perf_counter() - begin)
+        metrics.count('sentences', len(sentences))
+        metrics.count('chars', sum(len(sentence) for sentence in sentences))
+        for sentence, pred in zip(sentences, preds):
+            output_writer.write(sentence, pred)
+    output_writer.close()
+    data_file.close()
+
+    print('--------', 'Testing finished', '--------')
+    result_cache.report()
+    print('Result saved at path', output_file_path)
+    report_score(output_file_path, output_format, test_dataset.data_path)
+
+
+def normalization_report(steps=None):
+    """
+    Report vocabulary size and model memory of train dataset without normalization and with each prefix of *steps*
+    :param steps: normalization steps, see normalize.py, default is all of *NORMALIZATION_STEPS*
+    :return: a list of (steps, vocabulary size, bytes of vocabulary dicts, bytes of model weights)
+    """
+    steps = list(NORMALIZATION_STEPS) if steps is None else steps
+    print('--------', 'Normalization begins', '--------')
+    print('%-40s %10s %14s %14s' % ('steps', 'features', 'vocab bytes', 'model bytes'))
+    report = list()
+    for k in range(len(steps) + 1):
+        dataset = Dataset('keyboard', vocab=Vocab([UNKNOWN]), normalization=steps[:k])
+        data_file = open(TRAIN_DATA, 'r')
+        for line in data_file:
+            dataset.parse_line(line, build=True)
+        data_file.close()
+
+        # Dicts of both directions with their keys, and weights, sums and steps of a model being trained
+        vocab = dataset.vocab
+        vocab_bytes = sys.getsizeof(vocab.labelToIdx) + sys.getsizeof(vocab.idxToLabel) + sum(
+            sys.getsizeof(key) for key in vocab.labelToIdx)
+        model = StructuredPerceptron(vocab.size())
+        model_bytes = model.theta.nbytes + model.theta_sum.nbytes + model.last_update.nbytes
+
+        report.append((steps[:k], vocab.size(), vocab_bytes, model_bytes))
+        print('%-40s %10d %14d %14d' % (','.join(steps[:k]) or 'none', vocab.size(), vocab_bytes, model_bytes))
+
+    base, last = report[0], report[-1]
+    print('Features reduced by %.2f%%, model memory reduced by %.2f%%' % (
+        100 * (1 - last[1] / base[1]), 100 * (1 - last[3] / base[3])))
+    print('--------', 'Normalization finished', '--------')
+    return report
+
+
+# Dataset and model of a worker process, inherited from the parent process when forked
+_worker_state = dict()
+
+
+def _init_worker(dataset, model, lexicon=None, output_format='plain'):
+    """
+    Keep dataset and model in a worker process
+    :param dataset: dataset whose vocabulary is used to generate features
+    :param model: model to be used
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param output_format: format of segmented output lines
+    :return: None
+    """
+    _worker_state['dataset'] = dataset
+    _worker_state['model'] = model
+    _worker_state['lexicon'] = lexicon
+    _worker_state['output_format'] = output_format
+
+
+def train_sentence(model, features, labels, metrics):
+    """
+    Update a model with a sentence and count updates and mistakes
+    :param model: a Perceptron or StructuredPerceptron
+    :param features: features of the sentence
+    :param labels: labels of the sentence
+    :param metrics: a Metrics
+    :return: None
+    """
+    begin = time.perf_counter()
+    if isinstance(model, StructuredPerceptron):
+        mistakes = 0
+        if len(features) > 0:  # There exists empty sentence in the dataset
+            mistakes = model.update(features, labels)
+        updates = int(mistakes > 0)
+    else:
+        updates = model.update_sentence(features, labels)
+        mistakes = updates
+    metrics.add_time('update', time.perf_counter() - begin)
+
+    metrics.count('sentences')
+    metrics.count('chars', len(features))
+    metrics.count('updates', updates)
+    metrics.count('mistakes', mistakes)
+
+
+def _train_shard(shard):
+    """
+    Train the model of a worker process for a round on a shard of train dataset
+    :param shard: a tuple of (index of shard, number of shards)
+    :return: a tuple of (weights and steps of the training state of the model, counters of the shard),
+             accumulated sums are left out since they are rebuilt from the mixed weights
+    """
+    dataset, model = _worker_state['dataset'], _worker_state['model']
+    metrics = Metrics()
+    for features, labels, words in dataset.shard(*shard):
+        train_sentence(model, features, labels, metrics)
+
+    state = dict((key, value) for key, value in model.get_state().items()
+                 if not key.endswith('_sum') and not key.endswith('last_update'))
+    return state, metrics.counters
+
+
+def mixed_epoch(train_dataset, model, workers, metrics, rounds=MIX_ROUNDS):
+    """
+    Train the model for one epoch with iterative parameter mixing: the epoch is split into *rounds* rounds,
+    in every round each worker trains a copy of the model on its own part of train dataset,
+    then weights of all copies are mixed. Mixing more often keeps copies from repeating the same corrections
+    :param train_dataset: train dataset
+    :param model: model to be trained
+    :param workers: number of worker processes
+    :param metrics: a Metrics collecting counters of workers
+    :param rounds: number of mixing rounds in the epoch
+    :return: None
+    """
+    train_dataset.load()
+    for r in range(rounds):
+        # Workers are forked every round, so they start from the mixed model without copying it
+        model.accumulate()
+        with get_fork_context().Pool(workers, _init_worker, (train_dataset, model)) as pool:
+            results = pool.map(_train_shard, [(r * workers + k, rounds * workers) for k in range(workers)])
+        model.set_state(mix_states(model.get_state(), [state for state, counters in results]))
+        for state, counters in results:
+            for name, value in counters.items():
+                metrics.count(name, value)
+    print('.' * workers, end='', flush=True)
+
+
+def resume_checkpoint(model, model_name, resume, stopping=None):
+    """
+    Restore training state from the checkpoint of a model if asked to and if it exists
+    :param model: model to be trained
+    :param model_name: model to be trained
+    :param resume: resume from checkpoint or not
+    :param stopping: an EarlyStopping restored from the checkpoint too
+    :return: the epoch to start training from, *EPOCH* if the checkpointed training has stopped early
+    """
+    checkpoint_path = os.path.join(MODEL_SAVE_PATH, model_name + CHECKPOINT_SUFFIX)
+    if not resume or not os.path.exists(checkpoint_path):
+        return 0
+    epoch = load_checkpoint(model, checkpoint_path, stopping)
+    if stopping is not None and stopping.stop():
+        print('Training stopped early at epoch', epoch - 1, 'already, nothing to resume')
+        return EPOCH
+    return epoch
+
+
+def get_snapshot(model, average):
+    """
+    Get a copy of a model for prediction, sharing the training state of it
+    :param model: model being trained
+    :param average: use averaged weights or not
+    :return: a shallow copy of *model* holding the weights to be saved
+    """
+    snapshot = copy.copy(model)
+    if average and isinstance(model, StructuredPerceptron):
+        snapshot.theta, snapshot.transitions = model.get_average()
+    elif average:
+        snapshot.theta = model.get_average()
+    return snapshot
+
+
+def load_dev(train_dataset):
+    """
+    Load dev dataset and the dictionary of train dataset, if dev dataset exists
+    :param train_dataset: train dataset, whose vocabulary is used by dev dataset
+    :return: a tuple of (dev dataset, dictionary), or (None, None) if there is no dev dataset
+    """
+    if not os.path.exists(DEV_DATA):
+        return None, None
+    return Dataset('dev', vocab=train_dataset.vocab), load_dictionary(TRAIN_DATA)
+
+
+def dev_score(model, average, dev_dataset, dictionary):
+    """
+    Evaluate a model being trained on dev dataset and print the score
+    :param model: model being trained
+    :param average: use averaged weights or not
+    :param dev_dataset: dev dataset
+    :param dictionary: words of train dataset, used for OOV recall
+    :return: a tuple of (p, r, f, oov_r, iv_r)
+    """
+    sentences = [''.join(words) for words in dev_dataset.words]
+    preds = predict_all(get_snapshot(model, average), dev_dataset.features)
+    result = score([get_words(sentence, pred) for sentence, pred in zip(sentences, preds)], dev_dataset.words,
+                   dictionary)
+    print('Dev  ', end='')
+    print_score(result)
+    return result
+
+
+def end_epoch(model, model_name, average, epoch, dev_dataset, dictionary, stopping):
+    """
+    Checkpoint the model every *CHECKPOINT_INTERVAL* epochs, evaluate it on dev dataset and save it if it is the best
+    :param model: model being trained
+    :param model_name: model being trained
+    :param average: use average model or not
+    :param epoch: number of finished epochs
+    :param dev_dataset: dev dataset, or None if there is no dev dataset
+    :param dictionary: words of train dataset, used for OOV recall
+    :param stopping: an EarlyStopping
+    :return: True if training should stop
+    """
+    model_path = os.path.join(MODEL_SAVE_PATH, model_name)
+
+    # Dev dataset is evaluated first, so the checkpoint keeps the state of early stopping after this epoch
+    stop = False
+    if dev_dataset is not None:
+        result = dev_score(model, average, dev_dataset, dictionary)
+        if stopping.update(result[2]):
+            model.save(model_path, average)
+        elif stopping.stop():
+            print('F-score has not improved for', stopping.patience, 'epochs, stop training')
+            stop = True
+
+    if stop or (epoch % CHECKPOINT_INTERVAL == 0 and epoch < EPOCH):
+        save_checkpoint(model, model_path + CHECKPOINT_SUFFIX, epoch, stopping)
+        if dev_dataset is None:
+            model.save(model_path, average)
+    return stop
+
+
+def report_score(output_file_path, output_format='plain', data_path=TEST_DATA):
+    """
+    Score test result against test answer, if test answer exists and the result is a plain file of test dataset
+    :param output_file_path: test result output path
+    :param output_format: format of test result
+    :param data_path: path of input data file
+    :return: None
+    """
+    if not os.path.exists(TEST_ANSWER) or output_format != 'plain' or output_file_path == '-' or data_path != TEST_DATA:
+        return
+    dictionary = load_dictionary(TRAIN_DATA) if os.path.exists(TRAIN_DATA) else None
+    print_score(score(load_words(output_file_path), load_words(TEST_ANSWER), dictionary))
+
+
+def train(model_name, average, stream=False, cache=False, workers=1, resume=False, metrics=None, extractors=0):
     """
     Train the model with train dataset
     :param model_name: model to be trained
     :param average: use average model or not
+    :param stream: read train dataset lazily instead of keeping it in memory
+    :param cache: use the on-disk feature cache
+    :param workers: number of worker processes, train with iterative parameter mixing if more than 1
+    :param resume: resume training from the checkpoint of the model
+    :param metrics: a Metrics exporting timings and counters of each epoch
+    :param extractors: if positive, extract features with this number of processes, those of the first epoch
+                       while the model is being updated, of every epoch if streaming, or of the feature cache
+                       when it is built
     :return: None
     """
+    metrics = Metrics() if metrics is None else metrics
     print('--------', 'Generating train dataset', '--------')
-    train_dataset = Dataset('train')
+    with metrics.timer('extract'):
+        train_dataset = Dataset('train', stream, cache, extractors=extractors)
     if not os.path.exists(VOCAB_PATH):
         train_dataset.save_vocab(VOCAB_PATH)
     model = Perceptron(train_dataset.vocab.size())
+    metrics.emit('dataset', vocab_size=train_dataset.vocab.size())
+
+    stopping = EarlyStopping(EARLY_STOP_PATIENCE, EARLY_STOP_DELTA)
+    start_epoch = resume_checkpoint(model, model_name, resume, stopping)
+    dev_dataset, dictionary = load_dev(train_dataset)
+
+    print('--------', 'Training begins', '--------')
+    for e in range(start_epoch, EPOCH):
+        print('Epoch', e, '  ', end='', flush=True)
+        begin = time.perf_counter()
+        if workers > 1:
+            mixed_epoch(train_dataset, model, workers, metrics)
+        else:
+            for i, (features, labels, words) in enumerate(metrics.timed(train_dataset, 'extract')):
+                train_sentence(model, features, labels, metrics)
+
+                if i % 2000 == 0:
+                    print('.', end='', flush=True)
+        print('')
+        metrics.add_time('epoch', time.perf_counter() - begin)
+        metrics.emit('epoch', epoch=e, vocab_size=model.dimension, nonzero=int(np.count_nonzero(model.theta)))
+        if end_epoch(model, model_name, average, e + 1, dev_dataset, dictionary, stopping):
+            break
+    print('--------', 'Training finished', '--------')
+
+    # With dev dataset, the best model has been saved already
+    if dev_dataset is None:
+        model.save(os.path.join(MODEL_SAVE_PATH, model_name), average)
+
+
+def incremental_train(model_name, model_class, average, stream=False, cache=False, metrics=None):
+    """
+    Warm-start a saved model and continue training it on new annotated data only.
+    New features of the data are appended to the vocabulary, so indexes of existing features and
+    the saved weights stay valid, and weights of new features start from 0
+    :param model_name: model to be trained
+    :param model_class: Perceptron or StructuredPerceptron
+    :param average: use average model or not
+    :param stream: read new data lazily instead of keeping it in memory
+    :param cache: use the on-disk feature cache
+    :param metrics: a Metrics exporting timings and counters of each epoch
+    :return: None
+    """
+    # Without the vocabulary of the saved model, a new one would be built from the new data alone
+    if not os.path.exists(VOCAB_PATH):
+        raise ValueError('Vocabulary %s does not exist, a model must be trained before it is updated' % VOCAB_PATH)
+
+    metrics = Metrics() if metrics is None else metrics
+    print('--------', 'Generating update dataset', '--------')
+    with metrics.timer('extract'):
+        update_dataset = Dataset('update', stream, cache, grow=True)
+    metrics.emit('dataset', vocab_size=update_dataset.vocab.size())
+
+    # Saved weights are padded to the grown vocabulary when loaded, averaging starts over from them.
+    # The grown vocabulary replaces the saved one only once the model is known to match it
+    model_path = os.path.join(MODEL_SAVE_PATH, model_name)
+    model = model_class(update_dataset.vocab.size())
+    model.load(model_path)
+    update_dataset.save_vocab(VOCAB_PATH)
+    dev_dataset, dictionary = load_dev(update_dataset)
 
     print('--------', 'Training begins', '--------')
-    for e in range(EPOCH):
+    for e in range(UPDATE_EPOCH):
         print('Epoch', e, '  ', end='', flush=True)
-        for i in range(len(train_dataset)):
-            features, labels, words = train_dataset[i]
-            for j in range(len(features)):
-                model.update(features[j], labels[j])
+        begin = time.perf_counter()
+        for i, (features, labels, words) in enumerate(metrics.timed(update_dataset, 'extract')):
+            train_sentence(model, features, labels, metrics)
 
             if i % 2000 == 0:
                 print('.', end='', flush=True)
         print('')
+        metrics.add_time('epoch', time.perf_counter() - begin)
+        metrics.emit('epoch', epoch=e, vocab_size=model.dimension, nonzero=int(np.count_nonzero(model.theta)))
+        if dev_dataset is not None:
+            dev_score(model, average, dev_dataset, dictionary)
     print('--------', 'Training finished', '--------')
+    model.save(model_path, average)
 
-    model.save(os.path.join(MODEL_SAVE_PATH, model_name), average)
+    # The checkpoint holds the training state before the update, resuming from it would drop the update
+    checkpoint_path = model_path + CHECKPOINT_SUFFIX
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+        print('Checkpoint', checkpoint_path, 'saved before the update is removed')
 
 
-def test(model_name, output_file_path):
+def test(model_name, output_file_path, stream=False, cache=False, bundle=False, workers=1,
+         metrics=None, lexicon_path=None, cache_size=0, output_format='plain', input_path=None):
     """
     Test the saved model with test dataset
     :param model_name: model to be used
     :param output_file_path: test result output path
+    :param stream: do not keep sentences of the feature cache in memory, test dataset is read lazily otherwise
+    :param cache: use the on-disk feature cache
+    :param bundle: load vocabulary and model from the model bundle
+    :param workers: number of worker processes, input lines are sharded across them if more than 1
+    :param metrics: a Metrics exporting timings and decoding latencies
+    :param lexicon_path: path of user lexicon, words of it are never split
+    :param cache_size: if positive, cache results of at most *cache_size* sentences and segment repeated lines once
+    :param output_format: format of test result, one of *OUTPUT_FORMATS*
+    :param input_path: segment this file instead of test dataset, '-' means stdin and a '.gz' suffix means gzip
     :return: None
     """
+    metrics = Metrics() if metrics is None else metrics
+    lexicon = load_lexicon(lexicon_path) if lexicon_path else None
     print('--------', 'Generating test dataset', '--------')
-    test_dataset = Dataset('test')
-    model = Perceptron(test_dataset.vocab.size())
-    model.load(os.path.join(MODEL_SAVE_PATH, model_name))
+    # Testing reads raw lines and extracts features as it goes, only the serial path reads features of the
+    # feature cache
+    cache = cache and workers <= 1 and cache_size <= 0 and input_path != '-'
+    with metrics.timer('extract'):
+        test_dataset, model = load_dataset_and_model('test', Perceptron, model_name, bundle, stream or not cache,
+                                                     cache, input_path)
 
     print('--------', 'Testing begins', '--------')
-    output_file = open(output_file_path, 'w')
-    for i in range(len(test_dataset)):
-        features, labels, words = test_dataset[i]
-        sentence = ''.join(words)
-        for j in range(len(features)):
-            pred = model.predict(features[j])
-            output_file.write(sentence[j])
-            if pred == 1:
-                output_file.write('  ')
-        output_file.write('\n')
+    if workers > 1:
+        with metrics.timer('decode'):
+            parallel_test(test_dataset, model, output_file_path, workers, lexicon, output_format, metrics)
+        metrics.emit('test', workers=workers)
+        return
+    if cache_size > 0:
+        result_cache = ResultCache(cache_size)
+        with metrics.timer('decode'):
+            cached_test(test_dataset, model, output_file_path, result_cache, lexicon, output_format, metrics)
+        metrics.emit('test', cache_hits=result_cache.hits, cache_misses=result_cache.misses,
+                     cache_hit_rate=result_cache.hit_rate())
+        return
+    output_writer = OutputWriter(output_file_path, output_format)
+    for sentences, window_features in read_windows(test_dataset, metrics):
+        for sentence, features in zip(sentences, window_features):
+            begin = time.perf_counter()
+            if features is None:
+                pred = list(itertools.chain.from_iterable(predict_chunks(model, test_dataset, sentence, lexicon)))
+            else:
+                pred = model.predict_sentence(features, lexicon.get_constraints(sentence) if lexicon else None)
+            metrics.observe('decode_latency', time.perf_counter() - begin)
+            metrics.count('sentences')
+            metrics.count('chars', len(sentence))
+            output_writer.write(sentence, pred)
+    output_writer.close()
+    metrics.emit('test')
     print('--------', 'Testing finished', '--------')
     print('Result saved at path', output_file_path)
+    report_score(output_file_path, output_format, test_dataset.data_path)
 
 
-def keyboard_test(model_name):
+def _segment_lines(lines):
+    """
+    Segment a shard of input lines in a worker process
+    :param lines: a list of input lines
+    :return: a tuple of (list of segmented output lines, seconds spent decoding, number of characters)
+    """
+    dataset, model = _worker_state['dataset'], _worker_state['model']
+    sentences = [''.join(line.split()) for line in lines]
+    begin = time.perf_counter()
+    preds = predict_sentences(model, dataset, sentences, _worker_state['lexicon'])
+    seconds = time.perf_counter() - begin
+    output = [format_line(sentence, pred, _worker_state['output_format']) for sentence, pred in zip(sentences, preds)]
+    return output, seconds, sum(len(sentence) for sentence in sentences)
+
+
+def parallel_test(test_dataset, model, output_file_path, workers, lexicon=None, output_format='plain', metrics=None):
+    """
+    Segment test dataset with a pool of worker processes, output lines keep the order of input lines
+    :param test_dataset: test dataset
+    :param model: model to be used
+    :param output_file_path: test result output path
+    :param workers: number of worker processes
+    :param lexicon: user lexicon forcing boundaries, or None
+    :param output_format: format of test result, one of *OUTPUT_FORMATS*
+    :param metrics: a Metrics collecting decoding latencies of batches measured by workers and counters
+    :return: None
+    """
+    metrics = Metrics() if metrics is None else metrics
+    context = get_fork_context()
+    data_file = open_text(test_dataset.data_path, 'r')
+    output_writer = OutputWriter(output_file_path, output_format)
+    with context.Pool(workers, _init_worker, (test_dataset, model, lexicon, output_format)) as pool:
+        for output, seconds, chars in pool.imap(_segment_lines, batched(data_file, BATCH_SIZE)):
+            metrics.observe('decode_batch_latency', seconds)
+            metrics.count('sentences', len(output))
+            metrics.count('chars', chars)
+            output_writer.write_lines(output)
+    output_writer.close()
+    data_file.close()
+
+    print('--------', 'Testing finished', '--------')
+    print('Result saved at path', output_file_path)
+    report_score(output_file_path, output_format, test_dataset.data_path)
+
+
+def keyboard_test(model_name, bundle=False, lexicon_path=None, cache_size=0):
     """
     Get a string from terminal and print segmented sentences
     :param model_name: model to be used
+    :param bundle: load vocabulary and model from the model bundle
+    :param lexicon_path: path of user lexicon, words of it are never split
+    :param cache_size: max number of sentences whose results are cached
     :return: None
     """
     print('--------', 'Loading vocabulary', '--------')
-    test_dataset = Dataset('keyboard')
-    model = Perceptron(test_dataset.vocab.size())
-    model.load(os.path.join(MODEL_SAVE_PATH, model_name))
+    test_dataset, model = load_dataset_and_model('keyboard', Perceptron, model_name, bundle)
+
+    lexicon = load_lexicon(lexicon_path) if lexicon_path else None
+    result_cache = ResultCache(cache_size)
 
     print('现在可以开始输入了！')
     while True:
         text = input()
         text = text.strip()
-        features = test_dataset.generate_features(text)
-        for i in range(len(features)):
-            pred = model.predict(features[i])
+        pred = cached_predict(model, test_dataset, [text], result_cache, lexicon)[0]
+        for i in range(len(pred)):
             print(text[i], end='')
-            if pred == 1:
+            if pred[i] == 1:
                 print('  ', end='')
         print('')
 
 
-def structured_train(model_name, average):
+def structured_train(model_name, average, stream=False, cache=False, workers=1, resume=False, metrics=None,
+                     extractors=0):
     """
     Train the model with train dataset
     :param model_name: model to be trained
     :param average: use average model or not
+    :param stream: read train dataset lazily instead of keeping it in memory
+    :param cache: use the on-disk feature cache
+    :param workers: number of worker processes, train with iterative parameter mixing if more than 1
+    :param resume: resume training from the checkpoint of the model
+    :param metrics: a Metrics exporting timings and counters of each epoch
+    :param extractors: if positive, extract features with this number of processes, those of the first epoch
+                       while the model is being updated, of every epoch if streaming, or of the feature cache
+                       when it is built
     :return: None
     """
+    metrics = Metrics() if metrics is None else metrics
     print('--------', 'Generating train dataset', '--------')
-    train_dataset = Dataset('train')
+    with metrics.timer('extract'):
+        train_dataset = Dataset('train', stream, cache, extractors=extractors)
     if not os.path.exists(VOCAB_PATH):
         train_dataset.save_vocab(VOCAB_PATH)
     model = StructuredPerceptron(train_dataset.vocab.size())
+    metrics.emit('dataset', vocab_size=train_dataset.vocab.size())
+
+    stopping = EarlyStopping(EARLY_STOP_PATIENCE, EARLY_STOP_DELTA)
+    start_epoch = resume_checkpoint(model, model_name, resume, stopping)
+    dev_dataset, dictionary = load_dev(train_dataset)
 
     print('--------', 'Training begins', '--------')
-    for e in range(EPOCH):
+    for e in range(start_epoch, EPOCH):
         print('Epoch', e, '  ', end='', flush=True)
-        for i in range(len(train_dataset)):
-            features, labels, words = train_dataset[i]
-
-            if len(features) > 0:  # There exists empty sentence in the dataset
-                model.update(features, labels)
+        begin = time.perf_counter()
+        if workers > 1:
+            mixed_epoch(train_dataset, model, workers, metrics)
+        else:
+            for i, (features, labels, words) in enumerate(metrics.timed(train_dataset, 'extract')):
+                train_sentence(model, features, labels, metrics)
 
-            if i % 2000 == 0:
-                print('.', end='', flush=True)
+                if i % 2000 == 0:
+                    print('.', end='', flush=True)
         print('')
+        metrics.add_time('epoch', time.perf_counter() - begin)
+        metrics.emit('epoch', epoch=e, vocab_size=model.dimension, nonzero=int(np.count_nonzero(model.theta)))
+        if end_epoch(model, model_name, average, e + 1, dev_dataset, dictionary, stopping):
+            break
     print('--------', 'Training finished', '--------')
 
-    model.save(os.path.join(MODEL_SAVE_PATH, model_name), average)
+    # With dev dataset, the best model has been saved already
+    if dev_dataset is None:
+        model.save(os.path.join(MODEL_SAVE_PATH, model_name), average)
 
 
-def structured_test(model_name, output_file_path):
+def structured_test(model_name, output_file_path, stream=False, cache=False, bundle=False, workers=1,
+                    metrics=None, lexicon_path=None, cache_size=0, output_format='plain', input_path=None):
     """
     Test the saved model with test dataset
     :param model_name: model to be used
     :param output_file_path: test result output path
+    :param stream: do not keep sentences of the feature cache in memory, test dataset is read lazily otherwise
+    :param cache: use the on-disk feature cache
+    :param bundle: load vocabulary and model from the model bundle
+    :param workers: number of worker processes, input lines are sharded across them if more than 1
+    :param metrics: a Metrics exporting timings and decoding latencies
+    :param lexicon_path: path of user lexicon, words of it are never split
+    :param cache_size: if positive, cache results of at most *cache_size* sentences and segment repeated lines once
+    :param output_format: format of test result, one of *OUTPUT_FORMATS*
+    :param input_path: segment this file instead of test dataset, '-' means stdin and a '.gz' suffix means gzip
     :return: None
     """
+    metrics = Metrics() if metrics is None else metrics
+    lexicon = load_lexicon(lexicon_path) if lexicon_path else None
     print('--------', 'Generating test dataset', '--------')
-    test_dataset = Dataset('test')
-    model = StructuredPerceptron(test_dataset.vocab.size())
-    model.load(os.path.join(MODEL_SAVE_PATH, model_name))
+    # Testing reads raw lines and extracts features as it goes, only the serial path reads features of the
+    # feature cache
+    cache = cache and workers <= 1 and cache_size <= 0 and input_path != '-'
+    with metrics.timer('extract'):
+        test_dataset, model = load_dataset_and_model('test', StructuredPerceptron, model_name, bundle,
+                                                     stream or not cache, cache, input_path)
 
     print('--------', 'Testing begins', '--------')
-    output_file = open(output_file_path, 'w')
-    for i in range(len(test_dataset)):
-        features, labels, words = test_dataset[i]
-        sentence = ''.join(words)
-        pred = model.predict(features)
-        for j in range(len(features)):
-            output_file.write(sentence[j])
-            if pred[j] == 1:
-                output_file.write('  ')
-        output_file.write('\n')
+    if workers > 1:
+        with metrics.timer('decode'):
+            parallel_test(test_dataset, model, output_file_path, workers, lexicon, output_format, metrics)
+        metrics.emit('test', workers=workers)
+        return
+    if cache_size > 0:
+        result_cache = ResultCache(cache_size)
+        with metrics.timer('decode'):
+            cached_test(test_dataset, model, output_file_path, result_cache, lexicon, output_format, metrics)
+        metrics.emit('test', cache_hits=result_cache.hits, cache_misses=result_cache.misses,
+                     cache_hit_rate=result_cache.hit_rate())
+        return
+    output_writer = OutputWriter(output_file_path, output_format)
+    # Sentences of a window are bucketed by length, so batches are padded to sentences of similar lengths
+    for sentences, window_features in read_windows(test_dataset, metrics):
+        preds = predict_buckets(model, test_dataset, sentences, window_features, lexicon, metrics)
+        metrics.count('sentences', len(sentences))
+        metrics.count('chars', sum(len(sentence) for sentence in sentences))
+        for sentence, pred in zip(sentences, preds):
+            output_writer.write(sentence, pred)
+    output_writer.close()
+    metrics.emit('test')
     print('--------', 'Testing finished', '--------')
     print('Result saved at path', output_file_path)
+    report_score(output_file_path, output_format, test_dataset.data_path)
 
 
-def structured_keyboard_test(model_name):
+def structured_keyboard_test(model_name, bundle=False, lexicon_path=None, cache_size=0):
     """
     Get a string from terminal and print segmented sentences
     :param model_name: model to be used
+    :param bundle: load vocabulary and model from the model bundle
+    :param lexicon_path: path of user lexicon, words of it are never split
+    :param cache_size: max number of sentences whose results are cached
     :return: None
     """
     print('--------', 'Loading vocabulary', '--------')
-    test_dataset = Dataset('keyboard')
-    model = StructuredPerceptron(test_dataset.vocab.size())
-    model.load(os.path.join(MODEL_SAVE_PATH, model_name))
+    test_dataset, model = load_dataset_and_model('keyboard', StructuredPerceptron, model_name, bundle)
+
+    lexicon = load_lexicon(lexicon_path) if lexicon_path else None
+    result_cache = ResultCache(cache_size)
 
     print('现在可以开始输入了！')
     while True:
         text = input()
         text = text.strip()
-        features = test_dataset.generate_features(text)
-        pred = model.predict(features)
-        for i in range(len(features)):
+        pred = cached_predict(model, test_dataset, [text], result_cache, lexicon)[0]
+        for i in range(len(pred)):
             print(text[i], end='')
             if pred[i] == 1:
                 print('  ', end='')
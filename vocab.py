@@ -8,6 +8,7 @@
 from constant import *
 
 import copy
+import itertools
 
 
 class Vocab(object):
@@ -48,6 +49,15 @@ class Vocab(object):
         except KeyError:
             return default
 
+    def get_indexes(self, keys, default=0):
+        """
+        Get indexes of many words at once
+        :param keys: an iterable of strings of words
+        :param default: index of words not in vocabulary, default value is 0
+        :return: a list of indexes of *keys* in vocabulary
+        """
+        return list(map(self.labelToIdx.get, keys, itertools.repeat(default)))
+
     def get_word(self, idx, default=UNKNOWN):
         """
         Get word from index